@@ -0,0 +1,74 @@
+import os
+import hashlib
+import threading
+import httpx
+from ai_agent import DatabaseAIAgent
+
+# Bounded pool shared by every session using the same connection
+DEFAULT_POOL_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_POOL_MAX_OVERFLOW", "10")),
+    "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+}
+
+_agents = {}
+_lock = threading.Lock()
+_http_client = None
+
+def get_http_client():
+    """Process-wide HTTP client reused by every ChatOpenAI instance"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+                    max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+                ),
+                timeout=httpx.Timeout(60.0, connect=10.0)
+            )
+        return _http_client
+
+def _registry_key(db_path, use_sql_server, pool_options):
+    """Identify an agent by its connection parameters and credentials"""
+    if use_sql_server:
+        connection = tuple(os.getenv(name, "") for name in ("DB_SERVER", "DB_DATABASE", "DB_USERNAME", "DB_DRIVER"))
+        secret = os.getenv("DB_PASSWORD", "")
+    else:
+        connection = (os.path.abspath(db_path),)
+        secret = ""
+    secret += "|" + os.getenv("OPENAI_API_KEY", "")
+    return (use_sql_server, connection, hashlib.sha256(secret.encode()).hexdigest(), tuple(sorted(pool_options.items())))
+
+def get_shared_agent(db_path="business.db", use_sql_server=False, **pool_options):
+    """Return the agent for these connection parameters, creating it on first use"""
+    options = dict(DEFAULT_POOL_OPTIONS, **pool_options)
+    key = _registry_key(db_path, use_sql_server, options)
+    http_client = get_http_client()
+    with _lock:
+        agent = _agents.get(key)
+        if agent is None:
+            agent = DatabaseAIAgent(db_path=db_path, use_sql_server=use_sql_server,
+                                    pool_options=options, http_client=http_client)
+            _agents[key] = agent
+        return agent
+
+def pool_metrics():
+    """Pool utilization of every shared agent, keyed by database"""
+    with _lock:
+        agents = list(_agents.items())
+    metrics = {}
+    for key, agent in agents:
+        name = key[1][1] if key[0] else os.path.basename(key[1][0])
+        metrics[name] = agent.pool_metrics()
+    metrics["shared_agents"] = len(agents)
+    return metrics
+
+def clear_registry():
+    """Dispose every shared engine (e.g. after credentials change)"""
+    with _lock:
+        for agent in _agents.values():
+            agent.engine.dispose()
+        _agents.clear()
@@ -1,15 +1,58 @@
 import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_experimental.sql import SQLDatabaseChain
+from langchain_experimental.sql.base import SQL_QUERY, SQL_RESULT
 from langchain.sql_database import SQLDatabase
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from schema_cache import SchemaCache
+from table_selector import TableSelector, count_tokens
+from tracing import new_id, tracer
+from chart_prep import infer_chart_spec
+from chart_pushdown import build_aggregate_query
+from sql_utils import UnsafeSQLError, ensure_select, extract_sql, fingerprint_sql, normalize_sql, tokenize_sql
+from index_advisor import load_rollups
+from materializer import RollupMaterializer
+from single_flight import single_flight
+from query_guard import QueryCostError, QueryGuard, QueryTimeoutError
+from sql_validator import SQLValidationError, SQLValidator
+from model_router import ComplexityClassifier, ModelRouter, TemplateMatcher
+from answer_cache import LRUCache, normalize_question, sqlite_data_version, answer_cache as shared_answer_cache
+from example_store import example_store as shared_example_store
 
 load_dotenv()
 
+# Trailing OFFSET ... ROWS [FETCH NEXT n ROWS ONLY] of a SQL Server query; group 2 is the FETCH count
+PAGING = re.compile(r"(?is)\boffset\s+\S+\s+rows?(\s+fetch\s+(?:first|next)\s+(\S+)\s+rows?\s+only)?$")
+
+# Diagnostics go to the log; per-question detail is also on the trace spans
+logger = logging.getLogger(__name__)
+
 class DatabaseAIAgent:
-    def __init__(self, db_path="business.db", use_sql_server=False):
+    def __init__(self, db_path="business.db", use_sql_server=False, use_cache=True, answer_cache=None,
+                 result_ttl=30, data_version_query=None, pool_options=None, http_client=None,
+                 schema_cache_dir=".schema_cache", table_top_k=3, table_embedder=None, llm=None,
+                 max_rows=None, fetch_chunk_size=5000, chart_pushdown=True, rollups=None, read_only=None,
+                 query_timeout=None, max_query_cost=None, example_store=None, use_examples=True, few_shot_k=3,
+                 max_repairs=None, small_llm=None, routing=None):
+        # Connection pool settings (pool_size, max_overflow, pool_pre_ping, pool_recycle, ...)
+        pool_options = pool_options or {}
+        # SQLite: generated SQL runs on query_only connections; only rollup maintenance gets a writable engine.
+        # SQL Server: ApplicationIntent=ReadOnly only routes to a readable secondary, it doesn't stop writes;
+        # set DB_READ_USERNAME/DB_READ_PASSWORD to a db_datareader login for that, otherwise the only
+        # protection is ensure_select refusing anything but a single SELECT
+        if read_only is None:
+            read_only = os.getenv("DB_READ_ONLY", "true").lower() == "true"
         if use_sql_server:
             # SQL Server connection
             server = os.getenv("DB_SERVER")
@@ -19,12 +62,39 @@ class DatabaseAIAgent:
             driver = os.getenv("DB_DRIVER", "ODBC Driver 17 for SQL Server")
             
             connection_string = f"mssql+pyodbc://{username}:{password}@{server}/{database}?driver={driver}"
-            self.engine = create_engine(connection_string)
+            read_string = connection_string
+            if read_only:
+                read_username = os.getenv("DB_READ_USERNAME")
+                if read_username:
+                    read_password = os.getenv("DB_READ_PASSWORD")
+                    read_string = f"mssql+pyodbc://{read_username}:{read_password}@{server}/{database}?driver={driver}"
+                else:
+                    logger.warning("DB_READ_USERNAME not set: generated SQL runs with the main login's permissions")
+                read_string += "&ApplicationIntent=ReadOnly"
+            self.engine = create_engine(read_string, **pool_options)
         else:
             # SQLite connection (default)
-            self.engine = create_engine(f"sqlite:///{db_path}")
+            connection_string = f"sqlite:///{db_path}"
+            self.engine = create_engine(connection_string, **pool_options)
+        # Cost ceiling checked from the query plan before execution, plus a statement timeout
+        self.guard = QueryGuard(self.engine, max_cost=max_query_cost, timeout=query_timeout, read_only=read_only)
+        # Full exports are expected to be large and slow, so they get their own ceilings (0 = none);
+        # the default cost ceiling is ten times the interactive one
+        self.export_timeout = float(os.getenv("EXPORT_TIMEOUT", "600"))
+        self.export_max_cost = float(os.getenv("EXPORT_MAX_COST", (self.guard.max_cost or 0) * 10))
+        self.write_engine = create_engine(connection_string) if read_only else self.engine
         
-        self.db = SQLDatabase(self.engine)
+        # Tables are reflected one at a time when a prompt first needs them
+        self.db = SQLDatabase(self.engine, lazy_table_reflection=True)
+        self.schema = SchemaCache(self.engine, cache_dir=schema_cache_dir)
+        # Only the top-k relevant tables are put into each prompt
+        self.table_selector = TableSelector(self.schema, top_k=table_top_k, embedder=table_embedder)
+        # Generated SQL is checked against the schema and compiled before it runs; failures go
+        # back to the LLM with the error, at most SQL_MAX_REPAIRS times
+        self.validator = SQLValidator(self.engine, self.schema)
+        if max_repairs is None:
+            max_repairs = int(os.getenv("SQL_MAX_REPAIRS", "2"))
+        self.max_repairs = max_repairs
         # Get API key from multiple sources
         api_key = os.getenv("OPENAI_API_KEY")
         try:
@@ -33,71 +103,666 @@ class DatabaseAIAgent:
         except:
             pass
         
-        self.llm = ChatOpenAI(
+        # Any LangChain chat model can be passed in (e.g. fake_llm.ScriptedChatModel)
+        self.llm = llm or ChatOpenAI(
             temperature=0,
-            model="gpt-3.5-turbo",
-            openai_api_key=api_key
+            model=os.getenv("LLM_MODEL", "gpt-3.5-turbo"),
+            openai_api_key=api_key,
+            http_client=http_client
         )
+        # Optional cheaper model for simple questions; SMALL_LLM_BASE_URL can point at a local
+        # OpenAI-compatible server
+        if small_llm is None and os.getenv("SMALL_LLM_MODEL"):
+            small_llm = ChatOpenAI(
+                temperature=0,
+                model=os.getenv("SMALL_LLM_MODEL"),
+                openai_api_key=api_key,
+                base_url=os.getenv("SMALL_LLM_BASE_URL") or None,
+                http_client=http_client
+            )
+        # Simple questions go to a SQL template or the small model, the rest to self.llm
+        if routing is None:
+            routing = os.getenv("MODEL_ROUTING", "true").lower() == "true"
+        self.router = None
+        if routing:
+            self.router = ModelRouter(self.llm, small_llm, templates=TemplateMatcher(self.schema),
+                                      classifier=ComplexityClassifier(self.table_selector))
         self.db_chain = SQLDatabaseChain.from_llm(
             llm=self.llm,
             db=self.db,
             verbose=True,
             return_intermediate_steps=True
         )
+        # Server-side cap on rows fetched per question; export_query bypasses it
+        self.max_rows = max_rows or int(os.getenv("AGENT_MAX_ROWS", "10000"))
+        self.fetch_chunk_size = fetch_chunk_size
+        # Aggregate truncated results for charts with an outer GROUP BY in the database
+        self.chart_pushdown = chart_pushdown
+        # Number of SQL statements sent to the database, in total and for the current question
+        self.execution_count = 0
+        self._local = threading.local()
+        # Execution metrics keyed by SQL fingerprint (literals replaced)
+        self.query_stats = {}
+        self._stats_lock = threading.Lock()
+        # Optional JSONL log of executed statements, the workload read by index_advisor
+        self.query_log_path = os.getenv("QUERY_LOG")
+        # Rollup tables (from index_advisor or built for hot queries) answer matching GROUP BY
+        # queries, refreshed incrementally once they are older than ROLLUP_MAX_STALENESS seconds
+        auto_create = os.getenv("AGENT_MATERIALIZE", "false").lower() == "true"
+        if rollups is None and (auto_create or os.getenv("AGENT_USE_ROLLUPS", "false").lower() == "true"):
+            rollups = load_rollups(self.engine)
+        self.materializer = RollupMaterializer(self.write_engine, rollups, auto_create=auto_create)
+        
+        # Answers are shared across sessions through the process-wide cache
+        self.answer_cache = None
+        if use_cache:
+            self.answer_cache = answer_cache or shared_answer_cache
+        
+        # Question -> SQL lives until the schema changes; SQL -> result is short-lived
+        # and also keyed on the data version so live tables never serve stale rows
+        self.sql_cache = LRUCache(maxsize=512, ttl=None)
+        self.result_cache = LRUCache(maxsize=128, ttl=result_ttl)
+        self.data_version_query = data_version_query or os.getenv("DB_DATA_VERSION_QUERY")
+        self._pragma_conn = None
+        self._pragma_lock = threading.Lock()
+        # Identical questions in flight on the same database share one run (password hidden)
+        self.connection_key = str(self.engine.url)
+        # SQL that answered earlier questions: few-shot context, or reused as is when the same question comes back
+        self.examples = None
+        if use_examples:
+            self.examples = example_store or shared_example_store
+        self.few_shot_k = few_shot_k
+        self.coalesce_wait = float(os.getenv("COALESCE_WAIT_SECONDS", "300"))
     
     def query(self, question):
         """Process natural language question and return answer"""
+        response = None
+        for event in self.stream_query(question):
+            if event["type"] == "done":
+                response = event["response"]
+        return response
+    
+    async def aquery(self, question, timeout=None, executor=None):
+        """Async version of query; the pipeline runs in a worker thread.
+        
+        On timeout a failure response is returned right away, while the worker
+        finishes in the background (its result still warms the caches).
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(executor, self.query, question), timeout)
+        except asyncio.TimeoutError:
+            return {
+                "success": False,
+                "error": f"Timed out after {timeout} seconds",
+                "answer": "Sorry, answering this question took too long. Please try again later.",
+                "executions": None
+            }
+    
+    async def aquery_many(self, questions, concurrency=4, timeout=None):
+        """Answer many questions with at most `concurrency` in flight, results in input order"""
+        semaphore = asyncio.Semaphore(concurrency)
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="aquery")
+        
+        async def run(question):
+            async with semaphore:
+                return await self.aquery(question, timeout=timeout, executor=executor)
+        
         try:
-            result = self.db_chain(question)
-            sql_query = result["intermediate_steps"][0] if result["intermediate_steps"] else None
+            return await asyncio.gather(*(run(question) for question in questions))
+        finally:
+            # Don't wait for workers that are still finishing timed-out questions
+            executor.shutdown(wait=False)
+    
+    def stream_query(self, question):
+        """Process a question incrementally.
+        
+        Yields ``{"type": "sql"}`` with the generated SQL, ``{"type": "rows"}``
+        with the result DataFrame, ``{"type": "token"}`` for each piece of the
+        answer as the LLM produces it and finally ``{"type": "done"}`` with the
+        same response dict ``query`` returns.
+        
+        While the same question is already being answered on this database,
+        the call waits for that run and replays its response instead.
+        """
+        key = (normalize_question(question), self.connection_key)
+        flight, leader = single_flight.begin(key)
+        if not leader:
+            response = single_flight.wait(flight, self.coalesce_wait)
+            if response is not None:
+                response = dict(response, coalesced=True, executions=0)
+                if response.get("sql_query"):
+                    yield {"type": "sql", "sql": response["sql_query"]}
+                if response.get("chart_data") is not None:
+                    yield {"type": "rows", "data": response["chart_data"], "truncated": response.get("truncated")}
+                yield {"type": "token", "text": response["answer"]}
+                yield {"type": "done", "response": response}
+                return
+        finished = not leader
+        try:
+            for event in self._stream_query(question):
+                if event["type"] == "done" and not finished:
+                    # Release the waiters before the caller gets to the last event; a failure may be
+                    # transient, so waiters get no result and run the question themselves
+                    response = event["response"]
+                    single_flight.finish(key, flight, response if response.get("success") else None)
+                    finished = True
+                yield event
+        finally:
+            if not finished:
+                single_flight.finish(key, flight)
+    
+    def _stream_query(self, question):
+        self._local.executions = 0
+        self._local.prompt_tokens_saved = 0
+        # Every stage below is a child span of this question's trace
+        trace_id, root_id = new_id(128), new_id()
+        self._local.trace = (trace_id, root_id)
+        started = time.time_ns()
+        data_version = self.data_version()
+        if self.answer_cache is not None:
+            cached = self.answer_cache.get(question, self.schema_fingerprint())
+            if cached is not None and cached.get("data_version") == data_version:
+                yield {"type": "sql", "sql": cached["sql_query"]}
+                yield {"type": "rows", "data": cached["chart_data"], "truncated": cached["truncated"]}
+                yield {"type": "token", "text": cached["answer"]}
+                tracer.record("query", started, time.time_ns(), trace_id=trace_id, span_id=root_id, cached=True)
+                yield {"type": "done", "response": dict(cached, cached=True, executions=0, trace_id=trace_id)}
+                return
+        # Only set when the router picks the route for this question
+        decision, attempts = None, []
+        try:
+            # Tier 1: question -> SQL, so a repeat question skips the SQL generation call
+            sql_key = (normalize_question(question), self.schema_fingerprint())
+            translation = self.sql_cache.get(sql_key)
+            # SQL from the cache was already stored as an example when it was first written
+            cached_sql = translation is not None
+            llm_inputs = None
+            example = None
+            if translation is None:
+                example = self._matching_example(question)
+                given_sql, llm = (example["sql"], None) if example else (None, None)
+                if example is None and self.router is not None:
+                    decision = self._route(question)
+                    given_sql, llm = decision["sql"], decision["llm"]
+                # Execution errors go back to the LLM like validation errors do
+                sql_query, llm_inputs, attempts, executed = self._write_sql(
+                    question, given_sql, llm, execute=lambda sql: self._run_sql(sql, data_version))
+                if len(attempts) > 1:
+                    # The stored example no longer works (e.g. the schema changed); the repaired SQL is new
+                    example = None
+                # Only SQL that ran is remembered for the question
+                translation = {"sql": sql_query, "route": decision["route"] if decision else None}
+                self.sql_cache.set(sql_key, translation)
+            else:
+                sql_query = translation["sql"]
+                # Anything but a single read-only SELECT is refused before it reaches the database
+                ensure_select(sql_query)
+                executed = self._run_sql(sql_query, data_version)
+            yield {"type": "sql", "sql": sql_query}
             
-            # Get data for charts - always try to extract data
-            chart_data = None
-            if sql_query:
-                try:
-                    # Handle different types of sql_query (string or dict)
-                    sql_to_execute = sql_query
-                    if isinstance(sql_query, dict):
-                        sql_to_execute = sql_query.get('sql', str(sql_query))
-                    elif isinstance(sql_query, str) and "SELECT" in sql_query.upper():
-                        # Find the actual SQL query
-                        lines = sql_query.split('\n')
-                        for line in lines:
-                            if line.strip().upper().startswith('SELECT'):
-                                sql_to_execute = line.strip()
-                                break
-                    
-                    chart_data = pd.read_sql(sql_to_execute, self.engine)
-                    print(f"Chart data extracted: {chart_data.shape}")
-                except Exception as e:
-                    print(f"Chart data extraction failed: {e}")
-                    # Try direct SQL execution as fallback
-                    try:
-                        # Extract SQL from intermediate steps more carefully
-                        if result.get("intermediate_steps"):
-                            for step in result["intermediate_steps"]:
-                                if isinstance(step, str) and "SELECT" in step.upper():
-                                    chart_data = pd.read_sql(step, self.engine)
-                                    print(f"Fallback chart data extracted: {chart_data.shape}")
-                                    break
-                    except Exception as fallback_error:
-                        print(f"Fallback also failed: {fallback_error}")
-                        pass
+            # The SQL was executed exactly once; the same DataFrame feeds the answer and the charts
+            executed_sql, rollup, chart_data, truncated = executed
+            logger.debug("Chart data extracted: %s%s", chart_data.shape, " (truncated)" if truncated else "")
+            chart_spec = infer_chart_spec(chart_data)
             
-            return {
+            # A truncated result would chart a sample, so let the database aggregate it for the
+            # chart only; the rows shown, hashed and sent to the answer prompt stay the capped result
+            chart_data_aggregated = None
+            if truncated and self.chart_pushdown:
+                chart_data_aggregated = self._aggregate_for_chart(executed_sql, chart_spec, data_version)
+            chart_pushdown = chart_data_aggregated is not None
+            yield {"type": "rows", "data": chart_data, "truncated": truncated}
+            
+            # The answer only needs the LLM again when the result set itself changed
+            result_hash = self._result_hash(chart_data)
+            answer = translation.get("answer") if translation.get("result_hash") == result_hash else None
+            if answer is None:
+                llm_inputs = llm_inputs or self._llm_inputs(question)
+                answer = ""
+                answer_llm = self.router.llm_for(translation.get("route")) if self.router else self.llm
+                for token in self._stream_answer(question, sql_query, chart_data, llm_inputs, answer_llm):
+                    answer += token
+                    yield {"type": "token", "text": token}
+                answer = answer.strip()
+                translation.update(answer=answer, result_hash=result_hash)
+            else:
+                yield {"type": "token", "text": answer}
+            
+            response = {
                 "success": True,
-                "answer": result["result"],
+                "answer": answer,
                 "sql_query": sql_query,
                 "chart_data": chart_data,
-                "has_chart": chart_data is not None and len(chart_data) > 0 if chart_data is not None else False
+                "chart_data_aggregated": chart_data_aggregated,
+                "has_chart": chart_data is not None and len(chart_data) > 0,
+                "truncated": truncated,
+                "row_limit": self.max_rows,
+                "executions": self._local.executions,
+                "cached": False,
+                "data_version": data_version,
+                "result_hash": result_hash,
+                "sql_fingerprint": fingerprint_sql(sql_query),
+                "chart_spec": chart_spec,
+                "chart_pushdown": chart_pushdown,
+                "rollup": rollup.name if rollup else None,
+                "prompt_tokens_saved": self._local.prompt_tokens_saved,
+                "example_reused": example is not None,
+                "attempts": attempts,
+                "repairs": max(len(attempts) - 1, 0),
+                "route": translation.get("route")
+            }
+            if self.answer_cache is not None:
+                self.answer_cache.put(question, self.schema_fingerprint(), response)
+            if self.examples is not None and example is None and not cached_sql and len(chart_data) > 0:
+                # SQL that ran and returned rows becomes an example for similar questions
+                self.examples.add(question, self.connection_key, sql_query, (time.time_ns() - started) / 1e9)
+        except QueryCostError as e:
+            response = {
+                "success": False,
+                "error": str(e),
+                "answer": f"Sorry, that query looks too expensive to run ({e}). Try narrowing it down, for example to a date range or a few products.",
+                "executions": self._local.executions
+            }
+        except QueryTimeoutError as e:
+            response = {
+                "success": False,
+                "error": str(e),
+                "answer": f"Sorry, the query was stopped because it ran too long ({e}). Try a narrower question.",
+                "executions": self._local.executions
+            }
+        except SQLValidationError as e:
+            response = {
+                "success": False,
+                "error": str(e),
+                "answer": f"Sorry, I couldn't write a working query for that question ({e}). Please try rephrasing it.",
+                "executions": self._local.executions,
+                "attempts": e.attempts,
+                "repairs": max(len(e.attempts) - 1, 0)
+            }
+        except UnsafeSQLError as e:
+            response = {
+                "success": False,
+                "error": str(e),
+                "answer": "Sorry, I can only run read-only SELECT queries. Please rephrase your question.",
+                "executions": self._local.executions
             }
         except Exception as e:
-            return {
+            response = {
                 "success": False,
                 "error": str(e),
-                "answer": "Sorry, I couldn't process your question. Please try rephrasing it."
+                "answer": "Sorry, I couldn't process your question. Please try rephrasing it.",
+                "executions": self._local.executions
             }
+        response["trace_id"] = trace_id
+        if decision is not None:
+            # SQL from a template or the small model that needed repairs was escalated to self.llm
+            response["route"] = decision["route"]
+            self.router.record(decision["route"], (time.time_ns() - started) / 1e9, response["success"],
+                               escalated=decision["route"] != "large" and bool(response.get("repairs")))
+        rows = len(response["chart_data"]) if response.get("chart_data") is not None else 0
+        tracer.record("query", started, time.time_ns(), trace_id=trace_id, span_id=root_id,
+                      status="OK" if response["success"] else "ERROR", cached=False,
+                      executions=self._local.executions, rows=rows)
+        yield {"type": "done", "response": response}
+    
+    def _cached_execute(self, sql_query, data_version):
+        """Tier 2: SQL -> result, only reused while the data version is unchanged"""
+        result_key = (normalize_sql(sql_query), data_version)
+        cached_result = self.result_cache.get(result_key)
+        if cached_result is None:
+            # Over-budget queries are refused before they reach the database
+            with self._span("cost_check") as span:
+                estimate = self.guard.check(sql_query)
+                if estimate:
+                    span.attributes["cost"] = float(estimate["cost"] or 0)
+            cached_result = self._execute_sql(sql_query)
+            self.result_cache.set(result_key, cached_result)
+        return cached_result
+    
+    def _run_sql(self, sql_query, data_version):
+        """Execute the SQL, or the rollup it routes to: (executed SQL, rollup, data, truncated)"""
+        executed_sql, rollup = self.materializer.route(sql_query)
+        return (executed_sql, rollup) + tuple(self._cached_execute(executed_sql, data_version))
+    
+    def _aggregate_for_chart(self, sql_query, chart_spec, data_version):
+        """Run the chart's GROUP BY over the full result in the database, or return None"""
+        # Stay under the row cap, or the capped fetch would cut the buckets off again
+        aggregate_sql = build_aggregate_query(sql_query, chart_spec, self.engine.dialect,
+                                              max_categories=min(200, self.max_rows), max_points=min(5000, self.max_rows))
+        if aggregate_sql is None:
+            return None
+        try:
+            data, _ = self._cached_execute(aggregate_sql, data_version)
+            logger.debug("Chart aggregation pushed down: %s", data.shape)
+            return data
+        except Exception as e:
+            logger.warning("Chart aggregation pushdown failed: %s", e)
+            return None
+    
+    def schema_fingerprint(self):
+        """Database and schema version hash, used to key cached SQL and answers"""
+        return self.schema.fingerprint()
+    
+    def data_version(self):
+        """Signal that changes whenever the data does, or None if unknown.
+        
+        Cached answers are shared by every agent in the process, so the value
+        must mean the same thing whichever agent or connection reads it.
+        """
+        if self.data_version_query:
+            with self.engine.connect() as conn:
+                return conn.exec_driver_sql(self.data_version_query).scalar()
+        if self.engine.dialect.name != "sqlite":
+            return None
+        path = self.engine.url.database
+        if path and path != ":memory:":
+            return sqlite_data_version(path)
+        # An in-memory database lives on one connection, whose own counter is only valid for this agent
+        return f"{id(self)}:{self._sqlite_pragma('data_version')}"
+    
+    def pool_metrics(self):
+        """Connection pool utilization for this agent's engine"""
+        pool = self.engine.pool
+        if not hasattr(pool, "checkedout"):
+            return {"pool": type(pool).__name__}
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        return {
+            "pool": type(pool).__name__,
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "utilization": pool.checkedout() / capacity if capacity else 0.0
+        }
+    
+    def _sqlite_pragma(self, name):
+        """Read a PRAGMA on a dedicated connection (data_version is per-connection)"""
+        if self.engine.dialect.name != "sqlite":
+            return None
+        with self._pragma_lock:
+            if self._pragma_conn is None:
+                self._pragma_conn = self.engine.raw_connection()
+                self._pragma_conn.detach()
+            cursor = self._pragma_conn.cursor()
+            try:
+                cursor.execute(f"PRAGMA {name}")
+                return cursor.fetchone()[0]
+            finally:
+                cursor.close()
+    
+    def _result_hash(self, data):
+        """Fingerprint of a result set's columns and values"""
+        digest = hashlib.sha1(",".join(map(str, data.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=False).values.tobytes())
+        return digest.hexdigest()
+    
+    def _span(self, name, **attributes):
+        """Child span of the current question's trace"""
+        trace_id, parent_id = getattr(self._local, "trace", (None, None))
+        return tracer.span(name, trace_id=trace_id, parent_id=parent_id, **attributes)
+    
+    def _llm_inputs(self, question):
+        """Build the prompt inputs used by the SQLDatabaseChain prompt"""
+        with self._span("schema_fetch") as span:
+            tables = self.table_selector.select(question)
+            self._local.prompt_tokens_saved = self.table_selector.tokens_saved(tables)
+            table_info = self.schema.get_table_info(tables)
+            span.attributes.update(tables=len(tables), table_names=",".join(tables),
+                                   prompt_tokens_saved=self._local.prompt_tokens_saved)
+        examples = ""
+        if self.examples is not None and self.few_shot_k:
+            with self._span("example_lookup") as span:
+                similar = self.examples.similar(question, self.connection_key, k=self.few_shot_k)
+                examples = self.examples.prompt_block(similar)
+                span.attributes["examples"] = len(similar)
+        return {
+            "input": f"{question}\n{SQL_QUERY}",
+            "top_k": str(self.db_chain.top_k),
+            "dialect": self.db.dialect,
+            "table_info": table_info,
+            "examples": examples,
+            "stop": ["\n" + SQL_RESULT],
+        }
+    
+    def _route(self, question):
+        """The router's decision for a question, recorded on the trace"""
+        with self._span("route") as span:
+            decision = self.router.route(question)
+            span.attributes.update(route=decision["route"], complexity=decision["complexity"],
+                                   reasons=",".join(decision["reasons"]))
+        return decision
+    
+    def _write_sql(self, question, sql_query=None, llm=None, execute=None):
+        """Generate SQL (unless given), validate it and repair it at most ``max_repairs`` times.
+        
+        The first generation uses ``llm`` when given; repairs always use the
+        main model. Valid SQL is passed to ``execute`` when given, and a database
+        error from it is repaired like a validation problem. Returns the SQL, the
+        prompt inputs if any were built, one entry per attempt with its problems,
+        latency and token counts, and what ``execute`` returned.
+        """
+        llm_inputs, attempts, problems = None, [], []
+        while True:
+            started = time.perf_counter()
+            usage = {"prompt_tokens": 0, "completion_tokens": 0}
+            if sql_query is None or problems:
+                llm_inputs = llm_inputs or self._llm_inputs(question)
+                inputs = llm_inputs
+                if problems:
+                    inputs = dict(llm_inputs, input=f"{question}\n{SQL_QUERY}{sql_query}\n"
+                                                    f"SQLError: {'; '.join(problems)}\n"
+                                                    f"Write a corrected query that fixes this error.\n{SQL_QUERY}")
+                if problems:
+                    sql_query, usage = self._generate_sql(inputs, "llm_sql_repair")
+                else:
+                    sql_query, usage = self._generate_sql(inputs, llm=llm)
+            ensure_select(sql_query)
+            with self._span("sql_validation", attempt=len(attempts)) as span:
+                problems = self.validator.validate(sql_query)
+                span.attributes["problems"] = len(problems)
+            seconds = round(time.perf_counter() - started, 4)
+            result = None
+            if not problems and execute is not None:
+                try:
+                    result = execute(sql_query)
+                except (QueryCostError, QueryTimeoutError, UnsafeSQLError):
+                    # Not something a rewrite of the same question would fix
+                    raise
+                except Exception as e:
+                    # The driver's own message, not pandas' "Execution failed on sql ..." wrapper
+                    error = e
+                    while error.__cause__ is not None:
+                        error = error.__cause__
+                    problems = [str(getattr(error, "orig", None) or error).strip().splitlines()[0]]
+            attempts.append(dict(sql=sql_query, problems=problems, seconds=seconds, **usage))
+            if not problems:
+                return sql_query, llm_inputs, attempts, result
+            logger.info("SQL attempt %d failed: %s", len(attempts), problems)
+            if len(attempts) > self.max_repairs:
+                raise SQLValidationError(problems[0], attempts)
+    
+    def _matching_example(self, question):
+        """A stored example whose SQL can be reused for this question, or None"""
+        if self.examples is None:
+            return None
+        with self._span("example_match") as span:
+            example = self.examples.match(question, self.connection_key)
+            span.attributes["reused"] = example is not None
+        return example
+    
+    def _prompt(self, llm_inputs):
+        """Render the SQLDatabaseChain prompt and its stop sequences"""
+        with self._span("prompt_build"):
+            inputs = {k: v for k, v in llm_inputs.items() if k not in ("stop", "examples")}
+            return self.db_chain.llm_chain.prompt.format(**inputs), llm_inputs.get("stop")
+    
+    def _token_usage(self, prompt, message):
+        """Prompt and completion tokens, from the provider when it reports them"""
+        usage = getattr(message, "usage_metadata", None) or {}
+        return {
+            "prompt_tokens": usage.get("input_tokens") or count_tokens(prompt),
+            "completion_tokens": usage.get("output_tokens") or count_tokens(message.content)
+        }
+    
+    def _generate_sql(self, llm_inputs, span_name="llm_sql_generation", llm=None):
+        """Ask the LLM for the SQL statement answering the question; returns (sql, token usage)"""
+        # Few-shot examples only go into the SQL prompt, not the answer prompt
+        prompt, stop = self._prompt(dict(llm_inputs, table_info=llm_inputs["table_info"] + llm_inputs.get("examples", "")))
+        with self._span(span_name) as span:
+            message = (llm or self.llm).invoke(prompt, stop=stop)
+            usage = self._token_usage(prompt, message)
+            span.attributes.update(usage)
+        return extract_sql(message.content), usage
+    
+    def _execute_sql(self, sql_query):
+        """Run the SQL once with a row cap, fetching in chunks.
+        
+        Returns the DataFrame and whether rows beyond ``max_rows`` were dropped.
+        """
+        self.execution_count += 1
+        self._local.executions += 1
+        started = time.perf_counter()
+        # Ask for one row more than the cap to find out whether the result was truncated
+        limited_sql = self._limit_sql(sql_query, self.max_rows + 1)
+        chunks = []
+        fetched = 0
+        with self.engine.connect() as conn, self.guard.time_limit(conn), \
+                self._row_count_cap(conn, sql_query, self.max_rows + 1):
+            # Execution lasts until the first chunk arrives; the rest is fetching
+            with self._span("sql_execution", sql_fingerprint=fingerprint_sql(sql_query)):
+                reader = pd.read_sql(text(limited_sql), conn, chunksize=self.fetch_chunk_size)
+                first = next(reader, None)
+            with self._span("result_fetch") as span:
+                if first is not None:
+                    chunks.append(first)
+                    fetched = len(first)
+                    while fetched <= self.max_rows:
+                        chunk = next(reader, None)
+                        if chunk is None:
+                            break
+                        chunks.append(chunk)
+                        fetched += len(chunk)
+                span.attributes["rows"] = fetched
+        data = pd.DataFrame()
+        if chunks:
+            data = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+        truncated = len(data) > self.max_rows
+        self._record_query(sql_query, time.perf_counter() - started, min(len(data), self.max_rows))
+        return data.head(self.max_rows), truncated
+    
+    def _record_query(self, sql_query, seconds, rows):
+        """Accumulate per-fingerprint execution metrics"""
+        fingerprint = fingerprint_sql(sql_query)
+        with self._stats_lock:
+            stats = self.query_stats.setdefault(fingerprint, {
+                "sql": normalize_sql(sql_query), "executions": 0, "total_seconds": 0.0, "rows": 0
+            })
+            stats["executions"] += 1
+            stats["total_seconds"] += seconds
+            stats["rows"] += rows
+            if self.query_log_path:
+                with open(self.query_log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"time": time.time(), "fingerprint": fingerprint, "sql": sql_query,
+                                        "seconds": round(seconds, 6), "rows": rows}) + "\n")
+        self.materializer.observe(sql_query, seconds)
+    
+    def query_metrics(self):
+        """Executed queries grouped by fingerprint, slowest in total first"""
+        with self._stats_lock:
+            metrics = [dict(stats, fingerprint=fingerprint) for fingerprint, stats in self.query_stats.items()]
+        return sorted(metrics, key=lambda stats: -stats["total_seconds"])
+    
+    def _limit_sql(self, sql_query, limit):
+        """Push a row cap into the statement using the dialect's syntax"""
+        sql = sql_query.strip().rstrip(";").strip()
+        if self.engine.dialect.name == "mssql":
+            # TOP can't be combined with OFFSET/FETCH, so cap the FETCH count instead
+            paging = PAGING.search(sql)
+            if paging:
+                if paging.group(1) is None:
+                    return f"{sql} FETCH NEXT {limit} ROWS ONLY"
+                if paging.group(2).isdigit():
+                    count = min(int(paging.group(2)), limit)
+                    return f"{sql[:paging.start(2)]}{count}{sql[paging.end(2):]}"
+                # ORDER BY is allowed in a derived table that has OFFSET/FETCH
+                return f"SELECT TOP {limit} * FROM (\n{sql}\n) AS capped"
+            if self._top_cannot_cap(sql):
+                # Capped with SET ROWCOUNT by _row_count_cap instead
+                return sql
+            # SQL Server rejects ORDER BY in derived tables, so add TOP to the outer SELECT instead
+            match = re.match(r"(?is)^select\s+(distinct\s+)?(?!top\b)", sql)
+            if match:
+                return f"{match.group(0)}TOP {limit} {sql[match.end():]}"
+            return sql
+        return f"SELECT * FROM (\n{sql}\n) AS capped LIMIT {limit}"
+    
+    @staticmethod
+    def _top_cannot_cap(sql):
+        """True for a WITH query or a top-level UNION/INTERSECT/EXCEPT, where TOP would cap only one SELECT"""
+        depth, words = 0, []
+        for kind, value in tokenize_sql(sql):
+            if value == "(":
+                depth += 1
+            elif value == ")":
+                depth -= 1
+            elif kind == "word" and depth == 0:
+                words.append(value.lower())
+        return bool(words) and (words[0] == "with" or bool({"union", "intersect", "except"} & set(words)))
+    
+    @contextmanager
+    def _row_count_cap(self, conn, sql_query, limit):
+        """On SQL Server, cap the statements _limit_sql can't with SET ROWCOUNT for the duration"""
+        sql = sql_query.strip().rstrip(";").strip()
+        if self.engine.dialect.name != "mssql" or not self._top_cannot_cap(sql) \
+                or PAGING.search(sql):
+            yield
+            return
+        conn.exec_driver_sql(f"SET ROWCOUNT {int(limit)}")
+        try:
+            yield
+        finally:
+            # The connection goes back to the pool; later statements on it must not be capped
+            conn.exec_driver_sql("SET ROWCOUNT 0")
+    
+    def export_query(self, sql_query, path, chunksize=50000):
+        """Stream the full, uncapped result of a query to a CSV file; returns the row count"""
+        ensure_select(sql_query)
+        # Exports have their own cost ceiling and timeout (EXPORT_MAX_COST, EXPORT_TIMEOUT)
+        self.guard.check(sql_query, max_cost=self.export_max_cost, max_rows=0)
+        self.execution_count += 1
+        rows = 0
+        with self.engine.connect() as conn, self.guard.time_limit(conn, timeout=self.export_timeout):
+            for i, chunk in enumerate(pd.read_sql(text(sql_query), conn, chunksize=chunksize)):
+                chunk.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+                rows += len(chunk)
+        return rows
+    
+    def _format_result(self, data, max_rows=100):
+        """Render a result set the way SQLDatabase.run does for the LLM"""
+        if data is None or len(data) == 0:
+            return ""
+        result = str(list(data.head(max_rows).itertuples(index=False, name=None)))
+        if len(data) > max_rows:
+            result += f" ... ({len(data)} rows in total)"
+        return result
+    
+    def _stream_answer(self, question, sql_query, data, llm_inputs, llm=None):
+        """Stream the final answer, phrased by the LLM from the captured result"""
+        answer_inputs = dict(llm_inputs)
+        answer_inputs["input"] = f"{question}\n{SQL_QUERY}{sql_query}\n{SQL_RESULT} {self._format_result(data)}\nAnswer:"
+        prompt, stop = self._prompt(answer_inputs)
+        # The span is recorded by hand because it spans the generator's yields
+        trace_id, parent_id = self._local.trace
+        started = time.time_ns()
+        answer = ""
+        for chunk in (llm or self.llm).stream(prompt, stop=stop):
+            if chunk.content:
+                answer += chunk.content
+                yield chunk.content
+        tracer.record("answer_generation", started, time.time_ns(), trace_id=trace_id, parent_id=parent_id,
+                      prompt_tokens=count_tokens(prompt), completion_tokens=count_tokens(answer))
     
     def get_table_info(self):
         """Get database schema information"""
-        return self.db.get_table_info()
\ No newline at end of file
+        return self.schema.get_table_info()
\ No newline at end of file
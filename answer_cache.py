@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import zlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+NUMBER_WORDS = {
+    "one": "1", "two": "2", "three": "3", "four": "4", "five": "5",
+    "six": "6", "seven": "7", "eight": "8", "nine": "9", "ten": "10",
+    "twenty": "20", "fifty": "50", "hundred": "100"
+}
+
+# Words the stand-in embedder treats as the same, and words it ignores
+SYNONYMS = {
+    "best": "top", "highest": "top", "most": "top", "largest": "top", "biggest": "top",
+    "worst": "bottom", "lowest": "bottom", "least": "bottom", "smallest": "bottom", "fewest": "bottom",
+    "daily": "day", "weekly": "week", "monthly": "month", "yearly": "year", "annual": "year"
+}
+STOP_WORDS = {"show", "me", "list", "give", "get", "what", "are", "is", "the", "a", "an", "of", "by", "per",
+              "each", "all", "please", "for"}
+
+# A paraphrase must agree on these, however similar the rest of the question is
+KEY_WORDS = {"top", "bottom", "not", "no", "without", "except", "never", "day", "week", "month", "quarter", "year"}
+
+def normalize_question(question):
+    """Lowercase, drop punctuation and spell numbers as digits"""
+    words = re.findall(r"[a-z0-9_]+", question.lower())
+    return " ".join(NUMBER_WORDS.get(word, word) for word in words)
+
+
+def key_terms(question):
+    """Numbers, ranking, negation and time-grain words: questions that differ in these ask for different results"""
+    words = [SYNONYMS.get(word, word) for word in normalize_question(question).split()]
+    return frozenset(word for word in words if word.isdigit() or word in KEY_WORDS)
+
+
+def sqlite_data_version(path):
+    """Version of a SQLite file's data that every connection and process agrees on.
+
+    ``PRAGMA data_version`` is only comparable on the connection that read it,
+    so this reads the header's file change counter (bumped by every commit in
+    rollback-journal mode) plus the WAL file's size and mtime (WAL mode commits
+    append to it). Returns None when the file doesn't exist.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(28)
+    except OSError:
+        return None
+    version = str(int.from_bytes(header[24:28], "big"))
+    try:
+        wal = os.stat(path + "-wal")
+        version += f":{wal.st_size}:{wal.st_mtime_ns}"
+    except OSError:
+        pass
+    return version
+
+
+class LRUCache:
+    """Thread-safe mapping with least-recently-used and time-to-live eviction"""
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def items(self):
+        """Live (key, value) pairs, oldest first"""
+        with self._lock:
+            return [(key, entry[1]) for key, entry in self._data.items() if not self._expired(entry)]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def _expired(self, entry):
+        return self.ttl is not None and time.monotonic() - entry[0] > self.ttl
+
+
+class HashingEmbedder:
+    """Local stand-in embedder: hashed word stems and character trigrams.
+
+    Synonyms are mapped to one word and stop words are skipped, so "Top 5
+    selling products" and "five best sellers" score about 0.83. Exposes
+    ``embed_query`` like LangChain embeddings, so ``OpenAIEmbeddings`` can be
+    swapped in for real paraphrase matching.
+    """
+
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def embed_query(self, text):
+        vector = np.zeros(self.dim)
+        for word in normalize_question(text).split():
+            word = SYNONYMS.get(word, word)
+            if word in STOP_WORDS:
+                continue
+            stem = re.sub(r"(ing|ers|er|es|s)$", "", word) if len(word) > 4 else word
+            vector[zlib.crc32(stem.encode()) % self.dim] += 2.0
+            padded = f" {stem} "
+            for i in range(len(padded) - 2):
+                vector[zlib.crc32(padded[i:i + 3].encode()) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class AnswerCache:
+    """Process-wide cache of answered questions keyed by question and schema.
+
+    With an embedder, a question can also be answered from a cached paraphrase
+    that scores at least ``similarity_threshold`` and has the same key terms.
+    The default threshold is calibrated for ``HashingEmbedder``: paraphrases
+    score about 0.8 or more, other questions on the same tables under 0.7.
+    """
+
+    def __init__(self, maxsize=256, ttl=300, embedder=None, similarity_threshold=0.75):
+        self.entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.similar_hits = 0
+
+    def get(self, question, schema_fingerprint):
+        """Return a cached response for the question or a close paraphrase"""
+        key = (normalize_question(question), schema_fingerprint)
+        entry = self.entries.get(key)
+        if entry is not None:
+            return entry["response"]
+        if self.embedder is None:
+            return None
+
+        # Fall back to the most similar cached question on the same schema
+        query_vector = np.asarray(self.embedder.embed_query(key[0]))
+        terms = key_terms(key[0])
+        best_key, best_score = None, self.similarity_threshold
+        for cached_key, cached in self.entries.items():
+            if cached_key[1] != schema_fingerprint or cached.get("vector") is None:
+                continue
+            # "Top 5" vs "top 10" or "bottom 5", or daily vs monthly, score high but need different SQL
+            if key_terms(cached_key[0]) != terms:
+                continue
+            score = float(np.dot(query_vector, cached["vector"]))
+            if score >= best_score:
+                best_key, best_score = cached_key, score
+        if best_key is None:
+            return None
+        entry = self.entries.get(best_key)
+        if entry is None:
+            return None
+        self.similar_hits += 1
+        return entry["response"]
+
+    def put(self, question, schema_fingerprint, response):
+        """Store a successful response (generated SQL, answer and result)"""
+        normalized = normalize_question(question)
+        vector = None
+        if self.embedder is not None:
+            vector = np.asarray(self.embedder.embed_query(normalized))
+        self.entries.set((normalized, schema_fingerprint), {"response": response, "vector": vector})
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        stats = self.entries.stats()
+        stats["similar_hits"] = self.similar_hits
+        return stats
+
+
+# Shared by every agent in the process
+answer_cache = AnswerCache()
@@ -1,9 +1,17 @@
 import streamlit as st
 import os
+import uuid
+import tempfile
 import plotly.express as px
-import plotly.graph_objects as go
-from ai_agent import DatabaseAIAgent
+import pandas as pd
+from agent_registry import get_shared_agent, pool_metrics
 from database import create_sample_database
+from history_store import ChatHistoryStore
+from answer_cache import LRUCache, normalize_question
+from chart_prep import infer_chart_spec, prepare_chart_data
+from tracing import tracer
+from job_queue import QueueFullError, job_queue
+from single_flight import single_flight
 
 # Page config
 st.set_page_config(
@@ -12,11 +20,22 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def get_figure_cache():
+    """Plotly figures shared by all reruns and sessions, keyed by result fingerprint and question"""
+    # A plain module global would be rebuilt empty on every rerun of this script
+    return LRUCache(maxsize=100, ttl=None)
+
 # Initialize session state
 if 'agent' not in st.session_state:
     st.session_state.agent = None
 if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
+    st.session_state.chat_history = ChatHistoryStore()
+if 'pending_jobs' not in st.session_state:
+    # Questions submitted to the shared job queue that haven't finished yet
+    st.session_state.pending_jobs = []
+if 'user_id' not in st.session_state:
+    st.session_state.user_id = uuid.uuid4().hex
 
 def main():
     # Logo section
@@ -81,9 +100,9 @@ def main():
                         if not os.path.exists("business.db"):
                             create_sample_database()
                             st.success("Sample database created!")
-                        st.session_state.agent = DatabaseAIAgent()
+                        st.session_state.agent = get_shared_agent()
                     else:
-                        st.session_state.agent = DatabaseAIAgent(use_sql_server=True)
+                        st.session_state.agent = get_shared_agent(use_sql_server=True)
                     
                     st.success("Agent initialized successfully!")
                 except Exception as e:
@@ -94,6 +113,34 @@ def main():
             with st.expander("Database Schema"):
                 st.text(st.session_state.agent.get_table_info())
             
+            with st.expander("Connection Pool"):
+                st.json(pool_metrics())
+            
+            with st.expander("⏱️ Performance"):
+                stage_stats = tracer.stage_stats()
+                if stage_stats:
+                    st.dataframe(pd.DataFrame(stage_stats).T[["count", "p50_ms", "p95_ms"]])
+                else:
+                    st.write("No timings recorded yet")
+                st.caption("Query guard")
+                st.json(st.session_state.agent.guard.stats())
+                st.caption("SQL validation")
+                st.json(st.session_state.agent.validator.stats())
+                if st.session_state.agent.router is not None and st.session_state.agent.router.stats():
+                    st.caption("Model routes")
+                    st.json(st.session_state.agent.router.stats())
+                st.caption("Job queue")
+                st.json(job_queue.metrics())
+                st.caption("Coalesced questions")
+                st.json(single_flight.stats())
+                if st.session_state.agent.examples is not None:
+                    st.caption("SQL examples")
+                    st.json(st.session_state.agent.examples.stats())
+                rollup_stats = st.session_state.agent.materializer.stats()
+                if rollup_stats["rollups"]:
+                    st.caption("Rollup tables")
+                    st.json(rollup_stats)
+            
             st.markdown(f"**Total Conversations:** {len(st.session_state.chat_history)}")
         else:
             st.warning("Please enter your OpenAI API key to continue")
@@ -128,35 +175,56 @@ def main():
                 if st.button("📊 Ask + Chart") and user_question:
                     process_question(user_question)
             
+            if st.session_state.pending_jobs:
+                show_pending_jobs()
+            
             # Show latest response
             if st.session_state.chat_history:
-                question, response = st.session_state.chat_history[-1]
+                index, question, response = st.session_state.chat_history.latest()
+                chart_data = st.session_state.chat_history.get_data(index)
                 st.subheader("Latest Response:")
                 if response["success"]:
                     st.success(f"**Q:** {question}")
                     st.write(f"**A:** {response['answer']}")
                     if response.get("sql_query"):
                         st.code(response["sql_query"], language="sql")
+                    if response.get("rollup"):
+                        st.caption(f"⚡ Answered from the pre-aggregated table {response['rollup']}")
+                    if response.get("example_reused"):
+                        st.caption("♻️ SQL reused from an earlier answer to the same question")
+                    if response.get("route") == "template":
+                        st.caption("📐 SQL built from a template, without the language model")
+                    if response.get("repairs"):
+                        st.caption(f"🔧 Query fixed after {response['repairs']} failed attempt(s)")
                     
                     # Chart options - always show if data exists
-                    if response.get("chart_data") is not None:
+                    if chart_data is not None:
                         try:
-                            data_len = len(response["chart_data"])
+                            data_len = len(chart_data)
                             if data_len > 0:
                                 st.success(f"📊 Chart data ready: {data_len} rows")
+                                if response.get("truncated"):
+                                    if response.get("chart_pushdown"):
+                                        st.info("Result exceeded the row limit, so the chart data was aggregated in the database.")
+                                    else:
+                                        st.warning(f"Result truncated to the first {response['row_limit']} rows.")
+                                    if st.button("📥 Export full result"):
+                                        export_full_result(response["sql_query"])
                                 
                                 # Auto-generate chart
                                 st.subheader("📊 Visual Report")
-                                create_chart(response["chart_data"], question)
+                                create_chart(*chart_source(index, response, chart_data), question,
+                                             key=f"latest_chart_{index}", spec=response.get("chart_spec"),
+                                             trace_id=response.get("trace_id"))
                                 
                                 # Show data table in expander
                                 with st.expander("📋 View Raw Data"):
-                                    st.dataframe(response["chart_data"])
+                                    st.dataframe(chart_data)
                             else:
                                 st.warning("Chart data is empty")
                         except Exception as e:
                             st.error(f"Chart display error: {e}")
-                            st.dataframe(response["chart_data"])
+                            st.dataframe(chart_data)
                     else:
                         st.info("No chart data available for this query")
                 else:
@@ -170,26 +238,25 @@ def main():
         if st.session_state.chat_history:
             st.subheader("📊 Chart Gallery")
             
-            # Filter conversations with chart data
-            chart_conversations = [(q, r) for q, r in st.session_state.chat_history 
-                                 if r.get("success") and r.get("chart_data") is not None]
-            
-            # Filter out empty dataframes
-            valid_chart_conversations = []
-            for q, r in chart_conversations:
-                try:
-                    if len(r["chart_data"]) > 0:
-                        valid_chart_conversations.append((q, r))
-                except:
-                    pass
-            chart_conversations = valid_chart_conversations
+            # Filter conversations with non-empty chart data (kept on disk until needed)
+            chart_conversations = [(index, q, r) for index, q, r in st.session_state.chat_history.items()
+                                   if r.get("success") and r.get("has_chart")]
             
             if chart_conversations:
                 st.write(f"Found {len(chart_conversations)} conversations with chart data")
                 
-                for i, (question, response) in enumerate(chart_conversations):
+                # Only the current page of charts is loaded and rendered
+                page_size = 5
+                pages = (len(chart_conversations) - 1) // page_size + 1
+                page = 1
+                if pages > 1:
+                    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key="gallery_page")
+                first = (page - 1) * page_size
+                
+                for i, (index, question, response) in enumerate(chart_conversations[first:first + page_size], start=first):
                     st.subheader(f"Chart {i+1}: {question}")
-                    create_chart(response["chart_data"], question)
+                    create_chart(*chart_source(index, response), question,
+                                 key=f"gallery_chart_{index}", spec=response.get("chart_spec"))
                     st.divider()
             else:
                 st.info("No chart data available. Ask questions that return data to generate charts!")
@@ -203,78 +270,82 @@ def main():
             
             # Clear history button
             if st.button("🗑️ Clear History"):
-                st.session_state.chat_history = []
+                st.session_state.chat_history.clear()
                 st.rerun()
             
             # Display all conversations
-            for i, (question, response) in enumerate(reversed(st.session_state.chat_history)):
-                with st.expander(f"#{len(st.session_state.chat_history)-i}: {question[:50]}...", expanded=False):
+            for index, question, response in reversed(st.session_state.chat_history.items()):
+                with st.expander(f"#{index + 1}: {question[:50]}...", expanded=False):
                     st.write(f"**Question:** {question}")
                     if response["success"]:
                         st.write(f"**Answer:** {response['answer']}")
                         if response.get("sql_query"):
                             st.code(response["sql_query"], language="sql")
-                        if response.get("chart_data") is not None:
+                        # Data is only loaded and charted when asked for
+                        if response.get("has_chart") and st.checkbox("📊 Show chart", key=f"history_show_{index}"):
+                            chart_data = st.session_state.chat_history.get_data(index)
                             try:
-                                if len(response["chart_data"]) > 0:
-                                    st.write("📊 **Chart Available**")
-                                    create_chart(response["chart_data"], question)
+                                create_chart(*chart_source(index, response, chart_data), question,
+                                             key=f"history_chart_{index}",
+                                             spec=response.get("chart_spec"))
                             except:
                                 st.write("📋 **Data Available**")
-                                st.dataframe(response["chart_data"])
+                                st.dataframe(chart_data)
                     else:
                         st.error(response["answer"])
         else:
             st.info("No chat history yet. Start asking questions in the Chat tab!")
 
-def create_chart(data, question):
-    """Create appropriate chart based on data"""
+def chart_source(index, response, data=None):
+    """(frame, fingerprint) to chart: the database-side aggregate of a truncated result if any, else the rows"""
+    history = st.session_state.chat_history
+    aggregated = history.get_data(index, "chart_data_aggregated")
+    if aggregated is not None:
+        return aggregated, f"{response.get('result_hash')}:aggregated"
+    return (history.get_data(index) if data is None else data), response.get("result_hash")
+
+def build_figure(data, question, spec=None):
+    """Build the Plotly figure for a result set from its aggregated/downsampled form"""
+    spec = spec or infer_chart_spec(data)
+    data = prepare_chart_data(data, spec)
+    x, y = spec["x"], spec["y"]
+    
+    # Choose chart type based on data structure
+    if spec["kind"] == "line":
+        # Line chart for time series
+        fig = px.line(data, x=x, y=y, title=f"📈 {question[:40]}...")
+    elif spec["kind"] == "scatter":
+        # Scatter plot for numeric vs numeric
+        fig = px.scatter(data, x=x, y=y, title=f"📈 {question[:40]}...")
+    elif spec["kind"] == "histogram":
+        # Single numeric column - pre-binned histogram
+        fig = px.bar(data, x="bin", y="count", title=f"📊 {question[:40]}...")
+        fig.update_layout(bargap=0)
+    else:
+        # Bar chart for categorical + numeric (top categories plus "Other")
+        color = y if pd.api.types.is_numeric_dtype(data[y]) else None
+        fig = px.bar(data, x=x, y=y, title=f"📊 {question[:40]}...", color=color)
+    
+    fig.update_layout(height=400)
+    return fig, data
+
+def create_chart(data, fingerprint, question, key=None, spec=None, trace_id=None):
+    """Create appropriate chart based on data, reusing the cached figure for known results"""
     try:
         st.write(f"📊 Generating chart for {len(data)} records...")
         
-        numeric_cols = data.select_dtypes(include=['number']).columns.tolist()
-        text_cols = data.select_dtypes(include=['object', 'string']).columns.tolist()
-        
-        # Limit data for better visualization
-        if len(data) > 15:
-            data = data.head(15)
-        
-        # Choose chart type based on data structure
-        if len(numeric_cols) >= 1 and len(text_cols) >= 1:
-            # Bar chart for categorical + numeric
-            fig = px.bar(
-                data, 
-                x=text_cols[0], 
-                y=numeric_cols[0],
-                title=f"📊 {question[:40]}...",
-                color=numeric_cols[0]
-            )
-        elif len(numeric_cols) >= 2:
-            # Scatter plot for numeric vs numeric
-            fig = px.scatter(
-                data,
-                x=numeric_cols[0],
-                y=numeric_cols[1],
-                title=f"📈 {question[:40]}..."
-            )
-        elif len(data.columns) >= 2:
-            # Default bar chart
-            fig = px.bar(
-                data,
-                x=data.columns[0],
-                y=data.columns[1],
-                title=f"📊 {question[:40]}..."
-            )
-        else:
-            # Single column - show as histogram
-            fig = px.histogram(
-                data,
-                x=data.columns[0],
-                title=f"📊 {question[:40]}..."
-            )
-        
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
+        figure_cache = get_figure_cache()
+        cache_key = (fingerprint, normalize_question(question)) if fingerprint else None
+        cached = figure_cache.get(cache_key) if cache_key else None
+        if cached is None:
+            with tracer.span("chart_prep", trace_id=trace_id, rows=len(data)) as span:
+                cached = build_figure(data, question, spec)
+                span.attributes["points"] = len(cached[1])
+            if cache_key:
+                figure_cache.set(cache_key, cached)
+        fig, data = cached
+        with tracer.span("chart_render", trace_id=trace_id):
+            st.plotly_chart(fig, use_container_width=True, key=key)
         
         # Show data table below chart
         with st.expander("📋 View Data Table"):
@@ -285,12 +356,73 @@ def create_chart(data, question):
         st.write("📋 **Raw Data:**")
         st.dataframe(data)
 
+def export_full_result(sql_query):
+    """Run the uncapped query to a CSV file and offer it for download"""
+    # A file per export, so concurrent exports of the same query don't overwrite each other
+    fd, path = tempfile.mkstemp(prefix="logx_export_", suffix=".csv")
+    os.close(fd)
+    try:
+        with st.spinner("Exporting full result..."):
+            rows = st.session_state.agent.export_query(sql_query, path)
+        with open(path, "rb") as f:
+            # Streamlit keeps its own copy of the data to serve the download
+            data = f.read()
+    except Exception as e:
+        st.error(f"Export failed: {str(e)}")
+        return
+    finally:
+        os.remove(path)
+    st.download_button(f"Download CSV ({rows} rows)", data, file_name="export.csv", mime="text/csv")
+
 def process_question(question):
-    """Process user question and display response"""
-    with st.spinner("Processing your question..."):
-        response = st.session_state.agent.query(question)
-        st.session_state.chat_history.append((question, response))
-        st.rerun()
+    """Submit the question to the background job queue; the Chat tab polls for the result"""
+    agent = st.session_state.agent
+    try:
+        job = job_queue.submit(st.session_state.user_id, question, lambda: agent.stream_query(question))
+        st.session_state.pending_jobs.append(job.id)
+    except QueueFullError as e:
+        st.error(str(e))
+
+@st.fragment(run_every=1.0)
+def show_pending_jobs():
+    """Poll this session's queued and running questions; finished ones move to the chat history"""
+    jobs = [job_queue.get(job_id) for job_id in st.session_state.pending_jobs]
+    finished = [job for job in jobs if job is None or job.done]
+    for job in jobs:
+        if job is None or job.done:
+            continue
+        with st.container(border=True):
+            snapshot = job.snapshot()
+            st.info(f"**Q:** {job.question}")
+            if job.status == "queued":
+                st.caption(f"⏳ Waiting in queue ({snapshot['wait_seconds']:.0f}s)")
+            else:
+                for event in list(job.events):
+                    if event["type"] == "sql":
+                        st.code(event["sql"], language="sql")
+                    elif event["type"] == "rows":
+                        note = " (truncated)" if event.get("truncated") else ""
+                        st.caption(f"📋 {len(event['data'])} rows returned{note}")
+                answer = job.answer_so_far()
+                st.write(f"**A:** {answer}▌" if answer else "⏳ Working on it...")
+            if st.button("✖ Cancel", key=f"cancel_{job.id}"):
+                job_queue.cancel(job.id)
+    
+    if finished:
+        for job in finished:
+            if job is None:
+                continue
+            response = job_queue.collect(job.id)
+            if job.status == "done":
+                st.session_state.chat_history.append(job.question, response)
+            elif job.status == "failed":
+                st.session_state.chat_history.append(job.question, {
+                    "success": False,
+                    "error": job.error,
+                    "answer": "Sorry, I couldn't process your question. Please try rephrasing it."
+                })
+        st.session_state.pending_jobs = [job.id for job in jobs if job is not None and not job.done]
+        st.rerun(scope="app")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,208 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import date, datetime
+import numpy as np
+from ai_agent import DatabaseAIAgent
+from answer_cache import AnswerCache
+from database import generate_database
+from example_store import ExampleStore
+from fake_llm import ScriptedChatModel
+from tracing import tracer
+
+# Fixed SQL per question, so every run does the same database work
+QUESTIONS = {
+    "Show me sales by product": "SELECT product_name, SUM(total_amount) AS revenue FROM sales GROUP BY product_name",
+    "Daily revenue trend": "SELECT date, SUM(total_amount) AS revenue FROM sales GROUP BY date ORDER BY date",
+    "Top 5 products by quantity sold": "SELECT product_name, SUM(quantity) AS units FROM sales GROUP BY product_name ORDER BY units DESC LIMIT 5",
+    "Stock movements by type": "SELECT movement_type, SUM(quantity) AS units FROM stock GROUP BY movement_type",
+    "List every sale with its amount": "SELECT date, product_name, total_amount FROM sales"
+}
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+
+def parse_size(size):
+    """'10k', '1m' or a plain row count"""
+    size = size.strip().lower()
+    if size in SIZES:
+        return SIZES[size]
+    match = re.fullmatch(r"(\d+)([km]?)", size)
+    if not match:
+        raise ValueError(f"Unknown size: {size}")
+    return int(match.group(1)) * {"": 1, "k": 1_000, "m": 1_000_000}[match.group(2)]
+
+def ensure_database(data_dir, rows, seed=0):
+    """Path of a generated database with `rows` sales, built on first use"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"bench_{rows}_seed{seed}.db")
+    if not os.path.exists(path):
+        print(f"Generating {rows:,} rows into {path}...")
+        started = time.perf_counter()
+        generate_database(path + ".tmp", sales_rows=rows, start_date=date(2024, 1, 1),
+                          end_date=date(2025, 12, 31), seed=seed)
+        os.replace(path + ".tmp", path)
+        print(f"Generated in {time.perf_counter() - started:.1f}s")
+    return path
+
+def make_agent(db_path, latency, token_delay, data_dir, routing=False):
+    """Agent with a scripted LLM and caches private to this run.
+
+    Routing is off unless asked for: templates answer some questions without
+    the LLM, which would make runs incomparable with unrouted ones.
+    """
+    llm = ScriptedChatModel(sql_by_question={re.escape(q): sql for q, sql in QUESTIONS.items()},
+                            latency=latency, token_delay=token_delay)
+    agent = DatabaseAIAgent(db_path, answer_cache=AnswerCache(), example_store=ExampleStore(), llm=llm,
+                            schema_cache_dir=os.path.join(data_dir, ".schema_cache"), routing=routing)
+    return agent, llm
+
+def run_pass(agent, questions, concurrency):
+    """Answer every question once; returns (responses, seconds)"""
+    started = time.perf_counter()
+    if concurrency > 1:
+        responses = asyncio.run(agent.aquery_many(questions, concurrency=concurrency))
+    else:
+        responses = [agent.query(question) for question in questions]
+    return responses, time.perf_counter() - started
+
+def run_size(db_path, rows, repeats=3, concurrency=1, latency=0.05, token_delay=0.0, data_dir=".bench_data", verbose=False,
+             routing=False):
+    """Benchmark one database size: a cold pass, warm repeats, then a separate memory pass"""
+    questions = list(QUESTIONS)
+    output = sys.stdout if verbose else io.StringIO()
+    tracer.reset()
+    agent, llm = make_agent(db_path, latency, token_delay, data_dir, routing)
+    passes = []
+    with redirect_stdout(output):
+        for _ in range(repeats):
+            responses, seconds = run_pass(agent, questions, concurrency)
+            passes.append({
+                "seconds": round(seconds, 4),
+                "questions_per_second": round(len(questions) / seconds, 2),
+                "executions_per_question": round(sum(r["executions"] or 0 for r in responses) / len(questions), 2),
+                "cached": sum(1 for r in responses if r.get("cached")),
+                "failed": [q for q, r in zip(questions, responses) if not r["success"]]
+            })
+    stages = tracer.stage_stats()
+    llm_calls = llm.calls
+
+    # tracemalloc slows allocation-heavy code, so memory is measured on its own cold pass
+    agent, _ = make_agent(db_path, latency, token_delay, data_dir, routing)
+    with redirect_stdout(output):
+        tracemalloc.start()
+        run_pass(agent, questions, 1)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "rows": rows,
+        "questions": len(questions),
+        "cold": passes[0],
+        "warm": passes[1:],
+        "stages": stages,
+        "llm_calls": llm_calls,
+        "peak_traced_mb": round(peak / 1024 / 1024, 1),
+        "max_rss_mb": max_rss_mb()
+    }
+
+def max_rss_mb():
+    """Peak resident memory of this process, or None where the resource module is missing (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+def print_report(results):
+    for run in results["runs"]:
+        cold, warm = run["cold"], run["warm"]
+        print(f"\n=== {run['rows']:,} rows ({'routed' if results['settings']['routing'] else 'unrouted'}) ===")
+        print(f"Cold: {cold['questions_per_second']} q/s, {cold['executions_per_question']} executions/question")
+        if warm:
+            qps = np.mean([p["questions_per_second"] for p in warm])
+            print(f"Warm: {qps:.2f} q/s, {warm[-1]['executions_per_question']} executions/question")
+        rss = "n/a" if run["max_rss_mb"] is None else f"{run['max_rss_mb']} MB"
+        print(f"LLM calls: {run['llm_calls']}, peak traced memory: {run['peak_traced_mb']} MB, max RSS: {rss}")
+        for name, stats in run["stages"].items():
+            print(f"  {name:<20} n={stats['count']:<4} p50={stats['p50_ms']:>9} ms  p95={stats['p95_ms']:>9} ms")
+        if cold["failed"]:
+            print(f"Failed: {cold['failed']}")
+
+def compare(results, baseline_path):
+    """Print cold throughput and per-stage p50 relative to an earlier results file"""
+    with open(baseline_path) as f:
+        earlier = json.load(f)
+    baseline = {run["rows"]: run for run in earlier["runs"]}
+    print(f"\n=== Compared with {baseline_path} ===")
+    if earlier["settings"].get("routing") != results["settings"]["routing"]:
+        print(f"Warning: model routing was {earlier['settings'].get('routing', 'unknown')} there and "
+              f"{results['settings']['routing']} here; the timings are not comparable")
+    for run in results["runs"]:
+        before = baseline.get(run["rows"])
+        if before is None:
+            continue
+        ratio = run["cold"]["questions_per_second"] / before["cold"]["questions_per_second"]
+        print(f"{run['rows']:,} rows: cold throughput x{ratio:.2f}")
+        for name, stats in run["stages"].items():
+            if name in before["stages"] and before["stages"][name]["p50_ms"]:
+                print(f"  {name:<20} p50 x{stats['p50_ms'] / before['stages'][name]['p50_ms']:.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline agent benchmark with a scripted LLM")
+    parser.add_argument("--sizes", default="10k,1m,10m", help="comma-separated sales row counts (10k, 1m, 10m, ...)")
+    parser.add_argument("--repeats", type=int, default=3, help="passes over the questions per size; the first is cold")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated seconds per LLM call")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="simulated seconds per streamed token")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=".bench_data")
+    parser.add_argument("--output", default=None, help="results file (default: benchmark_results/<time>_<commit>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare against")
+    parser.add_argument("--routing", action="store_true", help="route questions to templates and the small model")
+    parser.add_argument("--verbose", action="store_true", help="show the agent's own output")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "settings": {"repeats": args.repeats, "concurrency": args.concurrency, "latency": args.latency,
+                     "token_delay": args.token_delay, "seed": args.seed, "routing": args.routing},
+        "runs": []
+    }
+    for size in args.sizes.split(","):
+        rows = parse_size(size)
+        db_path = ensure_database(args.data_dir, rows, seed=args.seed)
+        print(f"Benchmarking {rows:,} rows...")
+        results["runs"].append(run_size(db_path, rows, repeats=args.repeats, concurrency=args.concurrency,
+                                        latency=args.latency, token_delay=args.token_delay,
+                                        data_dir=args.data_dir, verbose=args.verbose, routing=args.routing))
+
+    output = args.output or os.path.join("benchmark_results", f"{datetime.now():%Y%m%d_%H%M%S}_{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print_report(results)
+    print(f"\nResults saved to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
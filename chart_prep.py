@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+DATE_PATTERN = r"^\d{4}-\d{2}(-\d{2})?([ T]\d{2}:\d{2}(:\d{2})?)?"
+
+def _is_date_like(series):
+    """True for datetime columns and text columns holding ISO dates (SQLite stores dates as text)"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return True
+    if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+        return False
+    sample = series.dropna().head(20).astype(str)
+    return len(sample) > 0 and bool(sample.str.match(DATE_PATTERN).all())
+
+def infer_chart_spec(data):
+    """Pick the chart kind and axes from column dtypes"""
+    if data is None or len(data.columns) == 0:
+        return None
+    numeric_cols = data.select_dtypes(include=['number']).columns.tolist()
+    date_cols = [c for c in data.columns if c not in numeric_cols and _is_date_like(data[c])]
+    text_cols = [c for c in data.select_dtypes(include=['object', 'string']).columns if c not in date_cols]
+
+    if date_cols and numeric_cols:
+        return {"kind": "line", "x": date_cols[0], "y": numeric_cols[0]}
+    if text_cols and numeric_cols:
+        return {"kind": "bar", "x": text_cols[0], "y": numeric_cols[0]}
+    if len(numeric_cols) >= 2:
+        return {"kind": "scatter", "x": numeric_cols[0], "y": numeric_cols[1]}
+    if len(data.columns) >= 2:
+        return {"kind": "bar", "x": data.columns[0], "y": data.columns[1]}
+    if numeric_cols:
+        return {"kind": "histogram", "x": numeric_cols[0], "y": "count"}
+    return {"kind": "bar", "x": data.columns[0], "y": "count"}
+
+def top_n_with_other(data, x, y, n=15):
+    """Sum y per category, keep the n largest and fold the rest into 'Other'"""
+    if y == "count":
+        totals = data[x].astype(str).value_counts()
+    else:
+        totals = data.groupby(data[x].astype(str), sort=False)[y].sum()
+    if len(totals) > n:
+        # Only reorder when categories have to be folded; otherwise keep the query's order
+        totals = totals.sort_values(ascending=False)
+        other = totals.iloc[n - 1:].sum()
+        totals = pd.concat([totals.iloc[:n - 1], pd.Series({"Other": other})])
+    return pd.DataFrame({x: totals.index, y: totals.to_numpy()})
+
+def histogram_bins(values, bins=30):
+    """Counts per equal-width bin, labelled by the bin's midpoint"""
+    values = pd.to_numeric(values, errors="coerce").dropna().to_numpy()
+    counts, edges = np.histogram(values, bins=bins)
+    return pd.DataFrame({"bin": (edges[:-1] + edges[1:]) / 2, "count": counts,
+                         "bin_start": edges[:-1], "bin_end": edges[1:]})
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling; returns the indices to keep"""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # The next bucket's average is the third corner of the triangle
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        areas = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        keep[i + 1] = previous
+    return keep
+
+def prepare_chart_data(data, spec, max_categories=15, max_points=2000, bins=30):
+    """Reduce a result set to what the chart needs: aggregated, binned or downsampled"""
+    kind, x, y = spec["kind"], spec["x"], spec["y"]
+    if kind == "histogram":
+        return histogram_bins(data[x], bins=bins)
+    if kind == "bar":
+        if y != "count" and not pd.api.types.is_numeric_dtype(data[y]):
+            return data.head(max_categories)
+        return top_n_with_other(data, x, y, n=max_categories)
+    if kind == "line":
+        series = data[[x, y]].dropna()
+        if not pd.api.types.is_datetime64_any_dtype(series[x]):
+            series = series.assign(**{x: pd.to_datetime(series[x], errors="coerce", format="ISO8601")}).dropna()
+        if not series[x].is_monotonic_increasing:
+            series = series.sort_values(x)
+        # Once sorted, repeated timestamps are adjacent
+        stamps = series[x].to_numpy()
+        if len(stamps) > 1 and (stamps[1:] == stamps[:-1]).any():
+            series = series.groupby(x, as_index=False)[y].sum()
+        if len(series) > max_points:
+            keep = lttb(series[x].to_numpy().astype("datetime64[ns]").astype(np.int64), series[y].to_numpy(), max_points)
+            series = series.iloc[keep]
+        return series.reset_index(drop=True)
+    if kind == "scatter" and len(data) > max_points:
+        rows = np.random.default_rng(0).choice(len(data), size=max_points, replace=False)
+        return data.iloc[np.sort(rows)]
+    return data
@@ -0,0 +1,73 @@
+import re
+from sqlalchemy import String, case, cast, column, func, literal, select, text
+from sql_utils import tokenize_sql
+
+def strip_order_by(sql):
+    """Drop a trailing top-level ORDER BY; None when row limiting depends on it"""
+    code = []
+    offset = 0
+    for kind, value in tokenize_sql(sql):
+        if kind not in ("space", "comment"):
+            code.append((offset, kind, value.lower()))
+        offset += len(value)
+    depth = 0
+    order_at = None
+    for i, (_, kind, value) in enumerate(code):
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+        elif depth == 0 and value == "order" and i + 1 < len(code) and code[i + 1][2] == "by":
+            order_at = i
+    if order_at is None:
+        return sql
+    head = [value for _, kind, value in code[:3]]
+    tail = {value for _, kind, value in code[order_at:] if kind == "word"}
+    if "top" in head or tail & {"offset", "fetch", "limit"}:
+        return None
+    return sql[:code[order_at][0]].rstrip()
+
+def build_aggregate_query(sql, spec, dialect, max_categories=200, max_points=5000):
+    """Wrap a generated SELECT in an outer GROUP BY query that feeds the chart.
+
+    Bars become SUM (or COUNT) per category, largest first, with everything past
+    the top ``max_categories - 1`` folded into an "Other" row. Time series become
+    SUM per timestamp, merged into at most ``max_points`` equal-count buckets over
+    the whole range (NTILE), so no part of the range is cut off. Returns None when
+    the chart can't be pushed down.
+    """
+    if not spec or spec["kind"] not in ("bar", "line"):
+        return None
+    x, y = spec["x"], spec["y"]
+    inner_sql = sql.strip().rstrip(";").strip()
+    if dialect.name == "mssql":
+        # SQL Server allows neither CTEs nor a plain ORDER BY inside a derived table
+        if re.match(r"(?i)^with\b", inner_sql):
+            return None
+        inner_sql = strip_order_by(inner_sql)
+        if inner_sql is None:
+            return None
+
+    columns = [column(x)] if y == "count" else [column(x), column(y)]
+    source = text(inner_sql).columns(*columns).subquery("chart_source")
+    measure = func.count() if y == "count" else func.sum(source.c[y])
+    per_x = select(source.c[x].label(x), measure.label(y)).group_by(source.c[x]).subquery("chart_totals")
+    if spec["kind"] == "line":
+        bucket = func.ntile(max_points).over(order_by=per_x.c[x]).label("bucket")
+        buckets = select(per_x.c[x], per_x.c[y], bucket).subquery("chart_buckets")
+        # Each bucket is labelled by its first timestamp; with fewer points than buckets nothing is merged
+        stmt = select(func.min(buckets.c[x]).label(x), func.sum(buckets.c[y]).label(y)) \
+            .group_by(buckets.c.bucket).order_by(func.min(buckets.c[x]))
+    else:
+        ranked = select(
+            per_x.c[x], per_x.c[y],
+            func.row_number().over(order_by=per_x.c[y].desc()).label("category_rank"),
+            func.count().over().label("categories")
+        ).subquery("chart_ranked")
+        label = case((ranked.c.categories <= max_categories, cast(ranked.c[x], String(255))),
+                     (ranked.c.category_rank < max_categories, cast(ranked.c[x], String(255))),
+                     else_=literal("Other"))
+        # Same top-N plus "Other" as chart_prep.top_n_with_other, with "Other" last
+        stmt = select(label.label(x), func.sum(ranked.c[y]).label(y)) \
+            .group_by(label).order_by(func.min(ranked.c.category_rank))
+    return str(stmt.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
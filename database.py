@@ -1,13 +1,16 @@
 import sqlite3
+import argparse
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-import random
+from datetime import date, timedelta
 
-def create_sample_database():
-    """Create sample database with sales and stock data"""
-    conn = sqlite3.connect('business.db')
-    
-    # Create tables
+BASE_PRODUCTS = ['Laptop', 'Mouse', 'Keyboard', 'Monitor', 'Headphones']
+
+SALES_INSERT = 'INSERT INTO sales (date, product_name, quantity, price, total_amount) VALUES (?, ?, ?, ?, ?)'
+STOCK_INSERT = 'INSERT INTO stock (product_name, date, movement_type, quantity, current_stock) VALUES (?, ?, ?, ?, ?)'
+
+def create_tables(conn):
+    """Create the sales and stock tables if they don't exist"""
     conn.execute('''
         CREATE TABLE IF NOT EXISTS sales (
             id INTEGER PRIMARY KEY,
@@ -18,7 +21,7 @@ def create_sample_database():
             total_amount DECIMAL(10,2)
         )
     ''')
-    
+
     conn.execute('''
         CREATE TABLE IF NOT EXISTS stock (
             id INTEGER PRIMARY KEY,
@@ -29,36 +32,111 @@ def create_sample_database():
             current_stock INTEGER
         )
     ''')
-    
-    # Generate sample data
-    products = ['Laptop', 'Mouse', 'Keyboard', 'Monitor', 'Headphones']
-    
-    # Sales data for last 2 months
-    sales_data = []
-    for i in range(100):
-        date = datetime.now() - timedelta(days=random.randint(0, 60))
-        product = random.choice(products)
-        quantity = random.randint(1, 10)
-        price = random.uniform(10, 1000)
-        sales_data.append((date.date(), product, quantity, price, quantity * price))
-    
-    conn.executemany('INSERT INTO sales (date, product_name, quantity, price, total_amount) VALUES (?, ?, ?, ?, ?)', sales_data)
-    
-    # Stock movement data
-    stock_data = []
-    for i in range(50):
-        date = datetime.now() - timedelta(days=random.randint(0, 30))
-        product = random.choice(products)
-        movement = random.choice(['IN', 'OUT'])
-        quantity = random.randint(1, 20)
-        current_stock = random.randint(10, 100)
-        stock_data.append((product, date.date(), movement, quantity, current_stock))
-    
-    conn.executemany('INSERT INTO stock (product_name, date, movement_type, quantity, current_stock) VALUES (?, ?, ?, ?, ?)', stock_data)
-    
-    conn.commit()
+
+def product_catalog(n_products, rng):
+    """Product names and list prices; beyond the base five, numbered variants are added"""
+    names = [BASE_PRODUCTS[i % len(BASE_PRODUCTS)] + (f" {i // len(BASE_PRODUCTS) + 1}" if i >= len(BASE_PRODUCTS) else "")
+             for i in range(n_products)]
+    # Log-normal list prices: many cheap accessories, a few expensive items
+    prices = np.round(np.clip(rng.lognormal(mean=4.5, sigma=1.0, size=n_products), 5, 5000), 2)
+    return np.array(names, dtype=object), prices
+
+def product_weights(n_products, distribution="zipf", zipf_exponent=1.1):
+    """Probability of each product appearing on a sale"""
+    if distribution == "uniform":
+        return np.full(n_products, 1.0 / n_products)
+    if distribution == "zipf":
+        weights = 1.0 / np.arange(1, n_products + 1) ** zipf_exponent
+        return weights / weights.sum()
+    raise ValueError(f"Unknown product distribution: {distribution}")
+
+def tune_for_bulk_load(conn):
+    """Trade durability for speed while the database is being generated"""
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-262144')
+
+def generate_database(db_path, sales_rows=1_000_000, stock_rows=None, n_products=5, start_date=None,
+                      end_date=None, product_distribution="zipf", quantity_mean=3.0, price_jitter=0.1,
+                      seed=None, chunk_size=500_000):
+    """Fill db_path with synthetic sales and stock rows, generated in vectorized chunks.
+
+    Rows are written in date order, one transaction per chunk, so tens of
+    millions of rows only ever hold ``chunk_size`` rows in memory. The same
+    ``seed`` always produces the same database.
+    """
+    rng = np.random.default_rng(seed)
+    end_date = end_date or date.today()
+    start_date = start_date or end_date - timedelta(days=730)
+    stock_rows = sales_rows // 10 if stock_rows is None else stock_rows
+    days = (end_date - start_date).days + 1
+    date_strings = np.array([(start_date + timedelta(days=d)).isoformat() for d in range(days)], dtype=object)
+    names, list_prices = product_catalog(n_products, rng)
+    weights = product_weights(n_products, product_distribution)
+
+    conn = sqlite3.connect(db_path)
+    tune_for_bulk_load(conn)
+    create_tables(conn)
+
+    def chunk_days(offset, n, total):
+        # Each chunk covers its share of the date range, so ids follow dates
+        low = days * offset // total
+        high = max(days * (offset + n) // total, low + 1)
+        return np.sort(rng.integers(low, high, n))
+
+    for offset in range(0, sales_rows, chunk_size):
+        n = min(chunk_size, sales_rows - offset)
+        product = rng.choice(n_products, size=n, p=weights)
+        quantity = rng.poisson(quantity_mean - 1, n) + 1
+        price = np.round(list_prices[product] * rng.uniform(1 - price_jitter, 1 + price_jitter, n), 2)
+        total = np.round(quantity * price, 2)
+        with conn:
+            conn.executemany(SALES_INSERT, zip(date_strings[chunk_days(offset, n, sales_rows)], names[product],
+                                               quantity.tolist(), price.tolist(), total.tolist()))
+
+    # Stock levels are running balances per product, carried across chunks
+    balance = rng.integers(50, 500, n_products)
+    for offset in range(0, stock_rows, chunk_size):
+        n = min(chunk_size, stock_rows - offset)
+        product = rng.choice(n_products, size=n, p=weights)
+        quantity = rng.integers(1, 21, n)
+        # Slightly more stock comes in than goes out, so balances drift up rather than below zero
+        inbound = rng.random(n) < 0.55
+        change = pd.Series(np.where(inbound, quantity, -quantity))
+        running = np.maximum(change.groupby(product).cumsum().to_numpy() + balance[product], 0)
+        last = pd.Series(running).groupby(product).last()
+        balance[last.index.to_numpy()] = last.to_numpy()
+        with conn:
+            conn.executemany(STOCK_INSERT, zip(names[product], date_strings[chunk_days(offset, n, stock_rows)],
+                                               np.where(inbound, 'IN', 'OUT').tolist(), quantity.tolist(),
+                                               running.tolist()))
     conn.close()
 
+def create_sample_database(db_path='business.db', sales_rows=100, stock_rows=50, seed=None):
+    """Create sample database with sales and stock data"""
+    today = date.today()
+    # Sales data for last 2 months
+    generate_database(db_path, sales_rows=sales_rows, stock_rows=stock_rows,
+                      start_date=today - timedelta(days=60), end_date=today, seed=seed)
+
 if __name__ == "__main__":
-    create_sample_database()
-    print("Sample database created successfully!")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate a sales/stock database")
+    parser.add_argument("--db", default="business.db")
+    parser.add_argument("--rows", type=int, default=None, help="sales rows (default: a 100-row sample)")
+    parser.add_argument("--stock-rows", type=int, default=None, help="stock movements (default: rows / 10)")
+    parser.add_argument("--products", type=int, default=5)
+    parser.add_argument("--start", type=date.fromisoformat, default=None, help="first date, YYYY-MM-DD")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="last date, YYYY-MM-DD (default: today)")
+    parser.add_argument("--distribution", choices=["zipf", "uniform"], default="zipf", help="product popularity")
+    parser.add_argument("--quantity-mean", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.rows is None:
+        create_sample_database(args.db, seed=args.seed)
+    else:
+        generate_database(args.db, sales_rows=args.rows, stock_rows=args.stock_rows, n_products=args.products,
+                          start_date=args.start, end_date=args.end, product_distribution=args.distribution,
+                          quantity_mean=args.quantity_mean, seed=args.seed)
+    print("Sample database created successfully!")
@@ -11,6 +11,7 @@ print(f"SQL Query type: {type(response['sql_query'])}")
 print(f"SQL Query: {response['sql_query']}")
 print(f"Chart data type: {type(response.get('chart_data'))}")
 print(f"Has chart: {response.get('has_chart')}")
+print(f"DB executions: {response.get('executions')}")
 
 if response.get('chart_data') is not None:
     print(f"Chart data shape: {response['chart_data'].shape}")
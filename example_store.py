@@ -0,0 +1,153 @@
+import os
+import json
+import logging
+import time
+import threading
+
+import numpy as np
+from answer_cache import HashingEmbedder, normalize_question
+
+logger = logging.getLogger(__name__)
+
+class ExampleStore:
+    """Persistent (question, validated SQL, latency) examples with a nearest-neighbor index.
+
+    Examples come from questions whose SQL ran and returned rows. They are
+    appended to a JSONL file and kept in memory as one normalized vector matrix
+    per database, so a lookup is a single matrix-vector product. Close matches
+    are put into the SQL prompt as few-shot examples only; the SQL is reused
+    outright only for the same question after normalization, since a one-word
+    paraphrase ("most" -> "least") can score high and need different SQL.
+    """
+
+    def __init__(self, path=None, embedder=None, max_examples=2000, min_similarity=0.3):
+        self.path = path
+        self.embedder = embedder or HashingEmbedder()
+        self.max_examples = max_examples
+        self.min_similarity = min_similarity
+        self.reused = 0
+        self.lookups = 0
+        self._examples = {}
+        self._index = {}
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def load(self):
+        """Read the examples file; later lines replace earlier ones for the same question"""
+        if not os.path.exists(self.path):
+            return
+        lines = 0
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                lines += 1
+                try:
+                    example = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                examples = self._examples.setdefault(example["database"], {})
+                examples.pop(example["normalized"], None)
+                examples[example["normalized"]] = example
+        for database in self._examples:
+            self._trim(database)
+        kept = [example for examples in self._examples.values() for example in examples.values()]
+        if lines > 2 * len(kept):
+            # Mostly replaced or trimmed lines: rewrite the file with the live examples only
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(example) + "\n" for example in kept)
+        logger.debug("Loaded %d SQL examples from %s", len(kept), self.path)
+
+    def add(self, question, database, sql, seconds):
+        """Remember the SQL that answered a question on a database"""
+        normalized = normalize_question(question)
+        example = {
+            "database": database,
+            "normalized": normalized,
+            "question": question,
+            "sql": sql,
+            "seconds": round(seconds, 4),
+            "time": time.time()
+        }
+        with self._lock:
+            examples = self._examples.setdefault(database, {})
+            if normalized in examples and examples[normalized]["sql"] == sql:
+                # Already stored: only keep it from being trimmed, without a new line or a rebuilt index
+                examples[normalized] = examples.pop(normalized)
+                return
+            examples.pop(normalized, None)
+            examples[normalized] = example
+            self._trim(database)
+            self._index.pop(database, None)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(example) + "\n")
+            # Kept in memory only, so a rebuilt index doesn't re-embed every stored question
+            example["vector"] = np.asarray(self.embedder.embed_query(normalized))
+
+    def similar(self, question, database, k=3):
+        """Up to k (similarity, example) pairs for the closest stored questions, best first"""
+        normalized = normalize_question(question)
+        with self._lock:
+            self.lookups += 1
+            index = self._ensure_index(database)
+            if index is None:
+                return []
+            keys, vectors = index
+            scores = vectors @ np.asarray(self.embedder.embed_query(normalized))
+            k = min(k, len(keys))
+            nearest = np.argpartition(-scores, k - 1)[:k]
+            examples = self._examples[database]
+            return [(float(scores[i]), examples[keys[i]]) for i in sorted(nearest, key=lambda i: -scores[i])
+                    if scores[i] >= self.min_similarity]
+
+    def match(self, question, database):
+        """The example for this exact (normalized) question, whose SQL can be reused, or None"""
+        with self._lock:
+            self.lookups += 1
+            example = self._examples.get(database, {}).get(normalize_question(question))
+            if example is None:
+                return None
+            example["uses"] = example.get("uses", 0) + 1
+            self.reused += 1
+        return example
+
+    def prompt_block(self, examples):
+        """Few-shot block appended to the table info of the SQL prompt"""
+        if not examples:
+            return ""
+        lines = ["", "/*", "Questions answered correctly on this database before:"]
+        for _, example in examples:
+            lines.append(f"Question: {example['question']}")
+            lines.append(f"SQLQuery: {' '.join(example['sql'].split())}")
+        lines.append("*/")
+        return "\n".join(lines)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "examples": sum(len(examples) for examples in self._examples.values()),
+                "lookups": self.lookups,
+                "reused": self.reused
+            }
+
+    def _ensure_index(self, database):
+        index = self._index.get(database)
+        examples = self._examples.get(database)
+        if index is None and examples:
+            keys = list(examples)
+            for key in keys:
+                if "vector" not in examples[key]:
+                    examples[key]["vector"] = np.asarray(self.embedder.embed_query(key))
+            vectors = np.array([examples[key]["vector"] for key in keys])
+            index = self._index[database] = (keys, vectors)
+        return index
+
+    def _trim(self, database):
+        # Oldest examples go first; the dict keeps insertion order
+        examples = self._examples[database]
+        while len(examples) > self.max_examples:
+            del examples[next(iter(examples))]
+
+
+# Shared by every agent in the process; EXAMPLE_STORE="" keeps examples in memory only
+example_store = ExampleStore(path=os.getenv("EXAMPLE_STORE", ".example_store.jsonl") or None)
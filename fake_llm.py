@@ -0,0 +1,62 @@
+import re
+import time
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+class ScriptedChatModel(BaseChatModel):
+    """Deterministic stand-in for ChatOpenAI, for tests and benchmarks.
+
+    SQL prompts are answered from ``sql_by_question`` (case-insensitive regex
+    matched against the question), repair prompts from ``repair_by_error``
+    (regex matched against the reported error), answer prompts from
+    ``answer_template``.
+    ``latency`` is added to every call and ``token_delay`` between streamed words.
+    """
+
+    sql_by_question: dict = {}
+    repair_by_error: dict = {}
+    default_sql: str = "SELECT 1"
+    answer_template: str = "Based on the query results: {result}"
+    latency: float = 0.0
+    token_delay: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def respond(self, prompt):
+        """The full reply for a rendered SQLDatabaseChain prompt"""
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = prompt.rstrip()
+        if prompt.endswith("Answer:"):
+            question = re.findall(r"Question: (.*)\n", prompt)[-1]
+            result = re.findall(r"SQLResult: (.*)\n", prompt)
+            result = result[-1][:200] if result else ""
+            return self.answer_template.format(question=question, result=result)
+        errors = re.findall(r"SQLError: (.*)", prompt)
+        for pattern, sql in self.repair_by_error.items():
+            if errors and re.search(pattern, errors[-1], re.IGNORECASE):
+                return sql
+        question = re.findall(r"Question: (.*)", prompt)[-1]
+        question = question.replace("SQLQuery:", "").strip()
+        for pattern, sql in self.sql_by_question.items():
+            if re.search(pattern, question, re.IGNORECASE):
+                return sql
+        return self.default_sql
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self.respond(messages[-1].content)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self.respond(messages[-1].content)
+        for token in re.findall(r"\S+\s*", text):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
@@ -0,0 +1,114 @@
+import os
+import logging
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Response fields holding result sets: spilled to disk and kept out of the metadata
+FRAMES = ("chart_data", "chart_data_aggregated")
+
+class ChatHistoryStore:
+    """Chat history for one session: metadata in memory, result sets spilled to disk.
+
+    Every result set (the rows and, for truncated results, the chart
+    aggregate) is written once to a compressed Parquet file. At most
+    ``memory_budget_mb`` of DataFrames stay in memory; the least recently
+    used ones are dropped and reloaded from disk on demand.
+    """
+
+    def __init__(self, spill_dir=None, memory_budget_mb=None):
+        if memory_budget_mb is None:
+            memory_budget_mb = float(os.getenv("HISTORY_MEMORY_MB", "64"))
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="logx_history_")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self.entries = []
+        self.loads = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        if spill_dir is None:
+            # Temporary spill directories go away with the session
+            weakref.finalize(self, shutil.rmtree, self.spill_dir, True)
+
+    def append(self, question, response):
+        """Record a response; its result sets are spilled and kept out of the metadata"""
+        meta = {key: value for key, value in response.items() if key not in FRAMES}
+        entry = {"question": question, "response": meta, "paths": {}, "rows": 0, "columns": []}
+        with self._lock:
+            index = len(self.entries)
+            for name in reversed(FRAMES):
+                data = response.get(name)
+                if data is None:
+                    continue
+                entry["paths"][name] = self._spill(index, name, data)
+                self._remember((index, name), data)
+            data = response.get("chart_data")
+            if data is not None:
+                entry["rows"] = len(data)
+                entry["columns"] = [str(column) for column in data.columns]
+            meta["has_chart"] = entry["rows"] > 0
+            self.entries.append(entry)
+        return index
+
+    def get_data(self, index, name="chart_data"):
+        """Result set of an entry (or None), from memory when possible, otherwise from disk"""
+        key = (index, name)
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return self._frames[key][0]
+            path = self.entries[index]["paths"].get(name)
+            if path is None:
+                return None
+            data = pd.read_pickle(path) if path.endswith(".pkl.gz") else pd.read_parquet(path)
+            self.loads += 1
+            self._remember(key, data)
+            return data
+
+    def latest(self):
+        """(index, question, response metadata) of the newest entry, or None"""
+        if not self.entries:
+            return None
+        index = len(self.entries) - 1
+        return index, self.entries[index]["question"], self.entries[index]["response"]
+
+    def items(self):
+        """(index, question, response metadata) for every entry, oldest first"""
+        return [(i, entry["question"], entry["response"]) for i, entry in enumerate(self.entries)]
+
+    def memory_usage(self):
+        """Bytes of DataFrames currently held in memory"""
+        return sum(size for _, size in self._frames.values())
+
+    def clear(self):
+        with self._lock:
+            self.entries = []
+            self._frames.clear()
+            for name in os.listdir(self.spill_dir):
+                os.remove(os.path.join(self.spill_dir, name))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _spill(self, index, name, data):
+        path = os.path.join(self.spill_dir, f"{name}_{index}.parquet")
+        try:
+            data.to_parquet(path, compression="zstd", index=False)
+        except Exception as e:
+            # Mixed-type object columns can't always be stored as Parquet
+            logger.warning("Parquet spill failed (%s), using pickle", e)
+            path = os.path.join(self.spill_dir, f"{name}_{index}.pkl.gz")
+            data.to_pickle(path, compression="gzip")
+        return path
+
+    def _remember(self, key, data):
+        self._frames[key] = (data, int(data.memory_usage(deep=True).sum()))
+        self._frames.move_to_end(key)
+        while len(self._frames) > 1 and self.memory_usage() > self.memory_budget:
+            self._frames.popitem(last=False)
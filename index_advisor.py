@@ -0,0 +1,552 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+from datetime import datetime
+from sqlalchemy import Column, Float, MetaData, String, Table, Text, create_engine, inspect, select, text
+from sql_utils import KEYWORDS, fingerprint_sql, normalize_sql, tokenize_sql
+
+# Registered rollups, so agents can find them after a restart
+ROLLUP_REGISTRY = "_advisor_rollups"
+
+_metadata = MetaData()
+_registry = Table(
+    ROLLUP_REGISTRY, _metadata,
+    Column("name", String(128), primary_key=True),
+    Column("definition", Text),
+    Column("built_at", String(32)),
+    Column("watermark", String(64)),
+    Column("refreshed_at", Float)
+)
+
+def load_workload(path):
+    """Aggregate a query log (JSONL with one executed statement per line) by fingerprint.
+
+    Returns the same shape as ``DatabaseAIAgent.query_metrics()``.
+    """
+    stats = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            fingerprint = entry.get("fingerprint") or fingerprint_sql(entry["sql"])
+            item = stats.setdefault(fingerprint, {
+                "fingerprint": fingerprint, "sql": normalize_sql(entry["sql"]), "executions": 0,
+                "total_seconds": 0.0, "rows": 0
+            })
+            item["executions"] += 1
+            item["total_seconds"] += entry.get("seconds", 0.0)
+            item["rows"] += entry.get("rows", 0)
+    return sorted(stats.values(), key=lambda item: -item["total_seconds"])
+
+def _tokens(sql):
+    """(offset, kind, value) for every token that isn't whitespace or a comment"""
+    tokens, offset = [], 0
+    for kind, value in tokenize_sql(sql):
+        if kind not in ("space", "comment"):
+            tokens.append((offset, kind, value))
+        offset += len(value)
+    return tokens
+
+def _name(kind, value):
+    return value[1:-1].lower() if kind == "identifier" else value.lower()
+
+def _clauses(tokens):
+    """Token index ranges of the top-level SELECT, FROM, WHERE, GROUP BY, HAVING, ORDER BY and LIMIT clauses"""
+    clauses, current, depth, i = {}, None, 0, 0
+    while i < len(tokens):
+        value = tokens[i][2].lower()
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+        elif depth == 0 and tokens[i][1] == "word":
+            if value in ("select", "from", "where", "having", "limit"):
+                current = value
+                clauses[current] = []
+                i += 1
+                continue
+            if value in ("group", "order") and i + 1 < len(tokens) and tokens[i + 1][2].lower() == "by":
+                current = value + " by"
+                clauses[current] = []
+                i += 2
+                continue
+        if current:
+            clauses[current].append(i)
+        i += 1
+    return clauses
+
+def _split_top_level(tokens, indices, separators):
+    """Split a clause at top-level separators (commas, AND)"""
+    parts, current, depth = [], [], 0
+    for i in indices:
+        value = tokens[i][2].lower()
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+        if depth == 0 and value in separators:
+            parts.append(current)
+            current = []
+        else:
+            current.append(i)
+    if current:
+        parts.append(current)
+    return parts
+
+def _select_aliases(tokens, indices):
+    """Token indices that name select-list aliases (with or without AS)"""
+    aliases = set()
+    for item in _split_top_level(tokens, indices, {","}):
+        if len(item) < 2:
+            continue
+        last, previous = tokens[item[-1]], tokens[item[-2]]
+        if last[1] not in ("word", "identifier") or last[2].lower() in KEYWORDS:
+            continue
+        if previous[2].lower() == "as" or previous[2] == ")" or (previous[1] in ("word", "identifier") and previous[2].lower() not in KEYWORDS):
+            aliases.add(item[-1])
+    return aliases
+
+def analyze_query(sql):
+    """Columns, filters, grouping and aggregates of a single-table SELECT, or None.
+
+    Joins, subqueries, set operations and CTEs are not analyzed.
+    """
+    sql = sql.strip().rstrip(";").strip()
+    tokens = _tokens(sql)
+    words = [value.lower() for _, kind, value in tokens if kind == "word"]
+    if not words or words[0] != "select" or words.count("select") != 1:
+        return None
+    if {"join", "union", "intersect", "except", "with"} & set(words):
+        return None
+    clauses = _clauses(tokens)
+    source = [tokens[i] for i in clauses.get("from", [])]
+    if not source or any(value == "," for _, _, value in source) or len(source) > 3:
+        return None
+    table = _name(source[0][1], source[0][2])
+    qualifiers = {table} | {_name(kind, value) for _, kind, value in source[1:] if value.lower() != "as"}
+
+    alias_indices = _select_aliases(tokens, clauses.get("select", []))
+    aliases = {_name(tokens[i][1], tokens[i][2]) for i in alias_indices}
+    info = {
+        "sql": sql, "tokens": tokens, "clauses": clauses, "table": table, "qualifiers": qualifiers,
+        "columns": [], "plain_columns": [], "aggregates": [], "where_eq": [], "where_range": [], "group_by": []
+    }
+
+    def column_at(i):
+        offset, kind, value = tokens[i]
+        following = tokens[i + 1][2] if i + 1 < len(tokens) else ""
+        previous = tokens[i - 1][2].lower() if i > 0 else ""
+        if kind not in ("word", "identifier") or (kind == "word" and value.lower() in KEYWORDS):
+            return None
+        if following in ("(", ".") or previous == "as" or i in alias_indices:
+            return None
+        name = _name(kind, value)
+        # ORDER BY and HAVING may refer to select aliases
+        return None if name in aliases and i not in clauses.get("select", []) and i not in clauses.get("where", []) else name
+
+    for clause in ("select", "where", "group by", "having", "order by"):
+        indices = clauses.get(clause, [])
+        position = 0
+        while position < len(indices):
+            i = indices[position]
+            value = tokens[i][2].lower()
+            if tokens[i][1] == "word" and value in ("sum", "count", "avg", "min", "max") \
+                    and i + 1 < len(tokens) and tokens[i + 1][2] == "(":
+                close, depth = i + 1, 0
+                for close in range(i + 1, len(tokens)):
+                    depth += {"(": 1, ")": -1}.get(tokens[close][2], 0)
+                    if depth == 0:
+                        break
+                inner = [j for j in range(i + 2, close) if tokens[j][2] != "."]
+                distinct = bool(inner) and tokens[inner[0]][2].lower() == "distinct"
+                inner = inner[1:] if distinct else inner
+                inner_columns = [name for name in (column_at(j) for j in inner) if name]
+                argument = None
+                if len(inner) == 1 and tokens[inner[0]][2] == "*":
+                    argument = "*"
+                elif len(inner_columns) == 1 and len([j for j in inner if tokens[j][2].lower() not in info["qualifiers"]]) == 1:
+                    argument = inner_columns[0]
+                info["aggregates"].append({
+                    "function": value, "argument": argument, "distinct": distinct, "clause": clause,
+                    "start": i, "end": close
+                })
+                info["columns"].extend(inner_columns)
+                while position < len(indices) and indices[position] <= close:
+                    position += 1
+                continue
+            name = column_at(i)
+            if name:
+                info["columns"].append(name)
+                info["plain_columns"].append(name)
+            position += 1
+
+    group = clauses.get("group by", [])
+    info["group_by"] = [name for name in (column_at(i) for i in group) if name]
+    # Equality against a literal can lead an index; anything else is a range or residual filter
+    conditions = _split_top_level(tokens, clauses.get("where", []), {"and"})
+    has_or = any(tokens[i][2].lower() == "or" for i in clauses.get("where", []))
+    for condition in conditions:
+        names = [name for name in (column_at(i) for i in condition) if name]
+        values = [tokens[i][2] for i in condition]
+        literal = [tokens[i][1] for i in condition if tokens[i][1] in ("string", "number")]
+        if not has_or and len(names) == 1 and "=" in values and len(literal) == 1 and len(condition) == 3:
+            info["where_eq"].append(names[0])
+        else:
+            info["where_range"].extend(names)
+    for key in ("columns", "plain_columns", "where_eq", "where_range", "group_by"):
+        info[key] = list(dict.fromkeys(info[key]))
+    return info
+
+def _quote(engine, name):
+    return engine.dialect.identifier_preparer.quote(name)
+
+def _object_name(prefix, table, columns):
+    name = f"{prefix}_{table}_{'_'.join(columns)}"
+    if len(name) > 60:
+        name = name[:50] + "_" + hashlib.sha1(name.encode()).hexdigest()[:8]
+    return name
+
+
+class Rollup:
+    """A pre-aggregated copy of one table: SUM of each measure and a row count per key.
+
+    ``rewrite`` turns a GROUP BY query over the base table into the same query
+    over the rollup whenever its filters, groups and aggregates fit the keys
+    and measures. ``watermark`` is the last source rowid (SQLite) or date
+    folded in, so ``refresh`` only has to aggregate newer rows.
+    """
+
+    def __init__(self, name, table, keys, measures, date_column=None):
+        self.name = name
+        self.table = table
+        self.keys = list(keys)
+        self.measures = list(measures)
+        self.date_column = date_column
+        self.watermark = None
+        self.refreshed_at = None
+
+    def to_dict(self):
+        return {"name": self.name, "table": self.table, "keys": self.keys, "measures": self.measures,
+                "date_column": self.date_column}
+
+    @classmethod
+    def from_dict(cls, definition):
+        return cls(definition["name"], definition["table"], definition["keys"], definition["measures"],
+                   definition.get("date_column"))
+
+    def select_sql(self, engine, where=None):
+        """The aggregate that fills the rollup, optionally over a slice of the table"""
+        keys = ", ".join(_quote(engine, key) for key in self.keys)
+        measures = "".join(f"SUM({_quote(engine, m)}) AS {_quote(engine, 'sum_' + m)}, " for m in self.measures)
+        where = f" WHERE {where}" if where else ""
+        return f"SELECT {keys}, {measures}COUNT(*) AS row_count FROM {_quote(engine, self.table)}{where} GROUP BY {keys}"
+
+    def create_sql(self, engine, where=None):
+        select_sql = self.select_sql(engine, where)
+        if engine.dialect.name == "mssql":
+            return select_sql.replace(" FROM ", f" INTO {_quote(engine, self.name)} FROM ", 1)
+        return f"CREATE TABLE {_quote(engine, self.name)} AS {select_sql}"
+
+    def watermark_column(self, dialect):
+        """rowid on SQLite; elsewhere the date key, so refreshes recompute from the last loaded day"""
+        return "rowid" if dialect.name == "sqlite" else self.date_column
+
+    def _latest(self, conn, column):
+        return conn.execute(text(f"SELECT MAX({_quote(conn, column)}) FROM {_quote(conn, self.table)}")).scalar()
+
+    def build(self, conn):
+        """(Re)create the rollup from the whole table and register it with its watermark"""
+        _metadata.create_all(conn, tables=[_registry], checkfirst=True)
+        column = self.watermark_column(conn.dialect)
+        latest = self._latest(conn, column) if column else None
+        where = None
+        if column == "rowid" and latest is not None:
+            # Rows inserted while building are left for the next refresh
+            where = f"rowid <= {int(latest)}"
+        if inspect(conn).has_table(self.name):
+            conn.execute(text(f"DROP TABLE {_quote(conn, self.name)}"))
+        conn.execute(text(self.create_sql(conn, where)))
+        if conn.dialect.name == "sqlite":
+            # Lets refresh merge new rows into existing groups with an upsert
+            keys = ", ".join(_quote(conn, key) for key in self.keys)
+            conn.execute(text(f"CREATE UNIQUE INDEX {_quote(conn, self.name + '_keys')} ON {_quote(conn, self.name)} ({keys})"))
+        self.watermark = None if latest is None else str(latest)
+        self.refreshed_at = time.time()
+        conn.execute(_registry.delete().where(_registry.c.name == self.name))
+        conn.execute(_registry.insert().values(name=self.name, definition=json.dumps(self.to_dict()),
+                                               built_at=datetime.now().isoformat(timespec="seconds"),
+                                               watermark=self.watermark, refreshed_at=self.refreshed_at))
+
+    def refresh(self, conn):
+        """Fold rows added since the watermark into the rollup instead of recomputing it.
+
+        Assumes the table is append-only; updates or deletes of already folded
+        rows need ``build``. Returns the new watermark.
+        """
+        column = self.watermark_column(conn.dialect)
+        if column is None or self.watermark is None:
+            self.build(conn)
+            return self.watermark
+        latest = self._latest(conn, column)
+        if latest is not None and str(latest) != self.watermark:
+            name = _quote(conn, self.name)
+            sums = [_quote(conn, "sum_" + m) for m in self.measures] + ["row_count"]
+            columns = ", ".join([_quote(conn, key) for key in self.keys] + sums)
+            if column == "rowid":
+                delta = self.select_sql(conn, f"rowid > {int(self.watermark)} AND rowid <= {int(latest)}")
+                updates = ", ".join(f"{c} = COALESCE({c} + excluded.{c}, {c}, excluded.{c})" for c in sums)
+                keys = ", ".join(_quote(conn, key) for key in self.keys)
+                conn.execute(text(f"INSERT INTO {name} ({columns}) {delta} ON CONFLICT ({keys}) DO UPDATE SET {updates}"))
+            else:
+                # Late rows for the last loaded day are picked up by recomputing from that day on
+                date_column = _quote(conn, column)
+                conn.execute(text(f"DELETE FROM {name} WHERE {date_column} >= :watermark"), {"watermark": self.watermark})
+                conn.execute(text(f"INSERT INTO {name} ({columns}) {self.select_sql(conn, f'{date_column} >= :watermark')}"),
+                             {"watermark": self.watermark})
+            self.watermark = str(latest)
+        self.refreshed_at = time.time()
+        conn.execute(_registry.update().where(_registry.c.name == self.name)
+                     .values(watermark=self.watermark, refreshed_at=self.refreshed_at))
+        return self.watermark
+
+    def supports(self, aggregate):
+        function, argument = aggregate["function"], aggregate["argument"]
+        if function == "sum" and not aggregate["distinct"]:
+            return argument in self.measures
+        if function == "count" and argument == "*":
+            return True
+        # MIN, MAX and COUNT(DISTINCT) over a key give the same result on the rollup
+        return argument in self.keys and (function in ("min", "max") or (function == "count" and aggregate["distinct"]))
+
+    def rewrite(self, sql):
+        """The query answered from the rollup, with the original column names, or None"""
+        info = analyze_query(sql)
+        if info is None or info["table"] != self.table or not (info["group_by"] or info["aggregates"]):
+            return None
+        if not set(info["plain_columns"]) <= set(self.keys):
+            return None
+        if not all(self.supports(aggregate) for aggregate in info["aggregates"]):
+            return None
+        tokens, sql = info["tokens"], info["sql"]
+        select_indices = set(info["clauses"].get("select", []))
+        aliases = _select_aliases(tokens, info["clauses"].get("select", []))
+        replacements = {info["clauses"]["from"][0]: (info["clauses"]["from"][0], self.name)}
+        for i, (_, kind, value) in enumerate(tokens):
+            if i + 1 < len(tokens) and tokens[i + 1][2] == "." and _name(kind, value) == self.table:
+                replacements[i] = (i, self.name)
+        for aggregate in info["aggregates"]:
+            start, end = aggregate["start"], aggregate["end"]
+            if aggregate["function"] == "sum":
+                replacement = f"SUM(sum_{aggregate['argument']})"
+            elif aggregate["function"] == "count" and aggregate["argument"] == "*":
+                replacement = "SUM(row_count)"
+            else:
+                continue
+            # Keep the column name the original expression would have had
+            following = tokens[end + 1] if end + 1 < len(tokens) else None
+            aliased = following is not None and (following[2].lower() == "as" or (end + 1) in aliases)
+            if start in select_indices and not aliased:
+                original = sql[tokens[start][0]:tokens[end][0] + 1].replace('"', '""')
+                replacement += f' AS "{original}"'
+            replacements[start] = (end, replacement)
+        parts, i = [], 0
+        while i < len(tokens):
+            if i in replacements:
+                end, replacement = replacements[i]
+                parts.append(replacement)
+                i = end + 1
+            else:
+                parts.append(tokens[i][2])
+                i += 1
+        return normalize_sql(" ".join(parts))
+
+
+def rollup_table_names(engine):
+    """The registry and every registered rollup table; internal, never shown to the LLM"""
+    if not inspect(engine).has_table(ROLLUP_REGISTRY):
+        return set()
+    with engine.connect() as conn:
+        return {ROLLUP_REGISTRY} | set(conn.execute(select(_registry.c.name)).scalars())
+
+def load_rollups(engine):
+    """Rollups registered in the database, with their watermarks"""
+    if not inspect(engine).has_table(ROLLUP_REGISTRY):
+        return []
+    with engine.connect() as conn:
+        rows = conn.execute(select(_registry.c.definition, _registry.c.watermark, _registry.c.refreshed_at)).all()
+    rollups = []
+    for definition, watermark, refreshed_at in rows:
+        rollup = Rollup.from_dict(json.loads(definition))
+        rollup.watermark, rollup.refreshed_at = watermark, refreshed_at
+        rollups.append(rollup)
+    return rollups
+
+
+class WorkloadAdvisor:
+    """Proposes covering indexes and rollup tables for the heaviest queries in a workload.
+
+    ``workload`` is a list of ``{"sql", "executions", "total_seconds"}`` entries,
+    from ``DatabaseAIAgent.query_metrics()`` or ``load_workload(path)``.
+    """
+
+    def __init__(self, engine, workload, max_index_columns=6, min_seconds=0.0):
+        self.engine = engine
+        self.workload = [item for item in workload if item.get("total_seconds", 0) >= min_seconds]
+        self.max_index_columns = max_index_columns
+        self._inspector = inspect(engine)
+
+    def _table_columns(self, table):
+        if not self._inspector.has_table(table):
+            return None
+        return {column["name"].lower(): column for column in self._inspector.get_columns(table)}
+
+    def recommend(self):
+        """Index and rollup recommendations, most workload time covered first"""
+        indexes, rollups = {}, {}
+        for item in self.workload:
+            info = analyze_query(item["sql"])
+            if info is None or info["table"].startswith("rollup_"):
+                continue
+            columns = self._table_columns(info["table"])
+            if columns is None or not set(info["columns"]) <= set(columns):
+                continue
+            self._add_index(indexes, info, item)
+            self._add_rollup(rollups, info, item, columns)
+        recommendations = self._prune_indexes(indexes) + list(rollups.values())
+        for recommendation in recommendations:
+            if recommendation["type"] == "rollup":
+                name = _object_name("rollup", recommendation["table"], recommendation["keys"])
+                recommendation["rollup"] = Rollup(name, recommendation["table"], recommendation["keys"],
+                                                  recommendation["measures"], recommendation["date_column"])
+                recommendation["sql"] = recommendation["rollup"].create_sql(self.engine)
+        return sorted(recommendations, key=lambda r: -r["seconds"])
+
+    def _add_index(self, indexes, info, item):
+        if not (info["where_eq"] or info["where_range"] or info["group_by"]):
+            return
+        key = list(dict.fromkeys(info["where_eq"] + info["group_by"] + info["where_range"][:1]))
+        covering = list(dict.fromkeys(key + sorted(info["columns"])))
+        columns = tuple(covering if len(covering) <= self.max_index_columns else key)
+        entry = indexes.setdefault((info["table"], columns), {
+            "type": "index", "table": info["table"], "columns": list(columns), "queries": [], "seconds": 0.0
+        })
+        entry["queries"].append(item["sql"])
+        entry["seconds"] += item.get("total_seconds", 0.0)
+
+    def _prune_indexes(self, indexes):
+        """Drop candidates that are a prefix of another candidate or of an existing index"""
+        existing = {}
+        for table in {table for table, _ in indexes}:
+            existing[table] = [[c.lower() for c in index["column_names"] if c]
+                               for index in self._inspector.get_indexes(table)]
+        kept = []
+        for (table, columns), entry in indexes.items():
+            wider = [other for (t, other) in indexes if t == table and len(other) > len(columns) and other[:len(columns)] == columns]
+            if any(existing_columns[:len(columns)] == list(columns) for existing_columns in existing[table]):
+                continue
+            if wider:
+                # The wider index serves these queries too
+                indexes[(table, wider[0])]["queries"].extend(entry["queries"])
+                indexes[(table, wider[0])]["seconds"] += entry["seconds"]
+                continue
+            entry["name"] = _object_name("ix", table, columns)
+            entry["sql"] = (f"CREATE INDEX {_quote(self.engine, entry['name'])} ON {_quote(self.engine, table)} "
+                            f"({', '.join(_quote(self.engine, c) for c in columns)})")
+            kept.append(entry)
+        return kept
+
+    def _add_rollup(self, rollups, info, item, columns):
+        aggregates = info["aggregates"]
+        if not info["group_by"] or not aggregates:
+            return
+        measures = [a["argument"] for a in aggregates if a["function"] == "sum" and not a["distinct"]]
+        if any(a["argument"] is None or a["function"] == "avg" for a in aggregates):
+            return
+        primary = {name for name, column in columns.items() if column.get("primary_key")}
+        # A date key keeps the rollup usable for date filters and daily trends
+        dates = [name for name, column in columns.items() if "DATE" in str(column["type"]).upper()]
+        keys = list(dict.fromkeys(dates[:1] + info["group_by"] + info["where_eq"] + info["where_range"]))
+        keys += [a["argument"] for a in aggregates if a["function"] in ("min", "max") or a["distinct"]]
+        keys = list(dict.fromkeys(keys))
+        if set(keys) & primary:
+            return
+        entry = rollups.setdefault(info["table"], {
+            "type": "rollup", "table": info["table"], "keys": [], "measures": [], "queries": [], "seconds": 0.0,
+            "date_column": dates[0] if dates else None
+        })
+        entry["keys"] = list(dict.fromkeys(entry["keys"] + keys))
+        entry["measures"] = list(dict.fromkeys(entry["measures"] + [m for m in measures if m not in entry["keys"]]))
+        entry["queries"].append(item["sql"])
+        entry["seconds"] += item.get("total_seconds", 0.0)
+
+    def _time_query(self, sql, repeats):
+        """Best-of-N wall time in milliseconds, fetching every row"""
+        best = None
+        with self.engine.connect() as conn:
+            for _ in range(repeats):
+                started = time.perf_counter()
+                conn.execute(text(sql)).fetchall()
+                elapsed = (time.perf_counter() - started) * 1000
+                best = elapsed if best is None else min(best, elapsed)
+        return round(best, 2)
+
+    def apply(self, recommendations, repeats=3):
+        """Create the recommended objects and time each affected query before and after.
+
+        ``baseline_ms`` is measured before anything is created; ``before_ms`` and
+        ``after_ms`` bracket one object, so each speed-up is attributed to the
+        object that caused it even when an earlier index already helped.
+        """
+        all_queries = dict.fromkeys(sql for recommendation in recommendations for sql in recommendation["queries"])
+        baseline = {sql: self._time_query(sql, repeats) for sql in all_queries}
+        report = []
+        for recommendation in recommendations:
+            queries = list(dict.fromkeys(recommendation["queries"]))
+            before = {sql: self._time_query(sql, repeats) for sql in queries}
+            with self.engine.begin() as conn:
+                if recommendation["type"] == "rollup":
+                    recommendation["rollup"].build(conn)
+                else:
+                    conn.execute(text(recommendation["sql"]))
+            print(f"Created {recommendation['type']}: {recommendation['sql']}")
+            for sql in queries:
+                routed = recommendation["rollup"].rewrite(sql) if recommendation["type"] == "rollup" else sql
+                report.append({
+                    "object": recommendation.get("name") or recommendation["rollup"].name,
+                    "type": recommendation["type"],
+                    "sql": sql,
+                    "routed_sql": routed if routed != sql else None,
+                    "baseline_ms": baseline[sql],
+                    "before_ms": before[sql],
+                    "after_ms": self._time_query(routed, repeats) if routed else None
+                })
+        return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommend indexes and rollup tables from a query log")
+    parser.add_argument("--db", default="business.db", help="SQLite database")
+    parser.add_argument("--log", default=os.getenv("QUERY_LOG", "query_log.jsonl"), help="query log written by the agent (QUERY_LOG)")
+    parser.add_argument("--apply", action="store_true", help="create the objects and time the workload before and after")
+    parser.add_argument("--report", default=None, help="save the before/after timings as JSON")
+    args = parser.parse_args()
+
+    engine = create_engine(f"sqlite:///{args.db}")
+    advisor = WorkloadAdvisor(engine, load_workload(args.log))
+    recommendations = advisor.recommend()
+    if not recommendations:
+        print("No recommendations for this workload")
+    for recommendation in recommendations:
+        print(f"[{recommendation['type']}] {recommendation['sql']}")
+        print(f"    serves {len(recommendation['queries'])} logged queries, {recommendation['seconds']:.3f}s in total")
+    if args.apply and recommendations:
+        report = advisor.apply(recommendations)
+        for row in report:
+            print(f"{row['baseline_ms']:>10} ms (baseline) {row['before_ms']:>10} ms -> {row['after_ms']:>10} ms "
+                  f"({row['type']})  {row['sql'][:60]}")
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(report, f, indent=2)
@@ -0,0 +1,200 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+import numpy as np
+from tracing import new_id, tracer
+
+class QueueFullError(RuntimeError):
+    """Raised when the queue (or one user's share of it) is full"""
+
+
+class Job:
+    """One submitted question: status, the events produced so far and the final response"""
+
+    def __init__(self, user, question, run):
+        self.id = new_id()
+        self.user = user
+        self.question = question
+        self.run = run
+        self.status = "queued"
+        self.events = []
+        self.response = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def answer_so_far(self):
+        return "".join(event["text"] for event in list(self.events) if event["type"] == "token")
+
+    def snapshot(self):
+        """Status fields safe to show in the UI"""
+        now = time.time()
+        return {
+            "id": self.id,
+            "question": self.question,
+            "status": self.status,
+            "wait_seconds": round((self.started_at or now) - self.submitted_at, 2),
+            "run_seconds": round((self.finished_at or now) - self.started_at, 2) if self.started_at else None
+        }
+
+
+class JobQueue:
+    """Bounded job queue served by a thread pool, round-robin across users.
+
+    Each user has their own FIFO; workers take the oldest job of the next user
+    in turn, so one user submitting many questions can't starve the others.
+    A job runs a callable that yields events (``DatabaseAIAgent.stream_query``);
+    they are stored on the job as they arrive so the UI can poll them.
+    """
+
+    def __init__(self, workers=4, max_queued=100, max_queued_per_user=5, keep_finished=500):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self.jobs = OrderedDict()
+        self.keep_finished = keep_finished
+        self.counters = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0, "cancelled": 0}
+        self._queues = OrderedDict()
+        self._waits = deque(maxlen=1000)
+        self._running = 0
+        self._threads = []
+        self._condition = threading.Condition()
+
+    def submit(self, user, question, run):
+        """Queue ``run()`` (an iterable of events) for ``user``; returns the Job at once"""
+        job = Job(user, question, run)
+        with self._condition:
+            queued = sum(len(jobs) for jobs in self._queues.values())
+            if queued >= self.max_queued:
+                self.counters["rejected"] += 1
+                raise QueueFullError(f"The server is busy ({queued} questions waiting). Please try again shortly.")
+            if len(self._queues.get(user, ())) >= self.max_queued_per_user:
+                self.counters["rejected"] += 1
+                raise QueueFullError(f"You already have {self.max_queued_per_user} questions waiting.")
+            self._queues.setdefault(user, deque()).append(job)
+            self.jobs[job.id] = job
+            self.counters["submitted"] += 1
+            self._start_workers()
+            self._forget_finished()
+            self._condition.notify()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def collect(self, job_id):
+        """A finished job's response, handed over once: its events and response are dropped, the status stays"""
+        with self._condition:
+            job = self.jobs.get(job_id)
+            if job is None or not job.done:
+                return None
+            response = job.response
+            # The caller keeps the result (the app moves it into the chat history), so don't hold it twice
+            job.events = []
+            job.response = None
+        return response
+
+    def cancel(self, job_id):
+        """Drop a queued job, or ask a running one to stop at its next event"""
+        with self._condition:
+            job = self.jobs.get(job_id)
+            if job is None or job.done:
+                return False
+            job.cancel_requested.set()
+            queue = self._queues.get(job.user)
+            if job.status == "queued" and queue is not None and job in queue:
+                queue.remove(job)
+                if not queue:
+                    del self._queues[job.user]
+                self._finish(job, "cancelled")
+        return True
+
+    def metrics(self):
+        """Queue depth, running jobs, wait-time percentiles and outcome counts"""
+        with self._condition:
+            depth = {user: len(jobs) for user, jobs in self._queues.items()}
+            waits = list(self._waits)
+            metrics = {
+                "queued": sum(depth.values()),
+                "running": self._running,
+                "workers": self.workers,
+                "users_waiting": len(depth),
+                **self.counters
+            }
+        if waits:
+            metrics["wait_p50_ms"] = round(float(np.percentile(waits, 50)), 1)
+            metrics["wait_p95_ms"] = round(float(np.percentile(waits, 95)), 1)
+        return metrics
+
+    def _start_workers(self):
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, daemon=True, name=f"job-worker-{len(self._threads)}")
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_job(self):
+        # Round-robin: take the first user's oldest job and move that user to the back
+        user, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        del self._queues[user]
+        if queue:
+            self._queues[user] = queue
+        return job
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._queues:
+                    self._condition.wait()
+                job = self._next_job()
+                job.status = "running"
+                job.started_at = time.time()
+                self._running += 1
+                self._waits.append((job.started_at - job.submitted_at) * 1000)
+            tracer.record("queue_wait", int(job.submitted_at * 1e9), int(job.started_at * 1e9), user=job.user)
+            status = "done"
+            try:
+                events = iter(job.run())
+                for event in events:
+                    job.events.append(event)
+                    if event["type"] == "done":
+                        job.response = event["response"]
+                    if job.cancel_requested.is_set() and job.response is None:
+                        # Closing the generator stops the pipeline before its next stage
+                        events.close()
+                        status = "cancelled"
+                        break
+                if status == "done" and job.response is None:
+                    status = "failed"
+            except Exception as e:
+                job.error = str(e)
+                status = "failed"
+            with self._condition:
+                self._running -= 1
+                self._finish(job, status)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        self.counters[status] += 1
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(len(finished) - self.keep_finished, 0)]:
+            del self.jobs[job_id]
+
+
+# Shared by every session of the app
+job_queue = JobQueue(
+    workers=int(os.getenv("JOB_WORKERS", "4")),
+    max_queued=int(os.getenv("JOB_MAX_QUEUED", "100")),
+    max_queued_per_user=int(os.getenv("JOB_MAX_PER_USER", "5"))
+)
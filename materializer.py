@@ -0,0 +1,132 @@
+import os
+import logging
+import time
+import threading
+from collections import Counter, defaultdict
+from index_advisor import WorkloadAdvisor, analyze_query, load_rollups
+from sql_utils import fingerprint_sql
+
+logger = logging.getLogger(__name__)
+
+class RollupMaterializer:
+    """Serves GROUP BY queries from rollup tables and keeps those rollups fresh.
+
+    A rollup counts as fresh for ``max_staleness`` seconds after its last
+    refresh; after that the next query that needs it first folds in the rows
+    added since its watermark. With ``auto_create`` a rollup is built in the
+    background once a query fingerprint has run ``hot_after`` times and cost
+    at least ``min_seconds`` in total.
+    """
+
+    def __init__(self, engine, rollups=None, max_staleness=None, auto_create=False, hot_after=3, min_seconds=0.5):
+        self.engine = engine
+        self.rollups = list(rollups or [])
+        if max_staleness is None:
+            max_staleness = float(os.getenv("ROLLUP_MAX_STALENESS", "60"))
+        self.max_staleness = max_staleness
+        self.auto_create = auto_create
+        self.hot_after = hot_after
+        self.min_seconds = min_seconds
+        self.counters = Counter()
+        self._workload = {}
+        self._locks = defaultdict(threading.Lock)
+        self._building = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_database(cls, engine, **options):
+        """Materializer over the rollups registered in the database"""
+        return cls(engine, load_rollups(engine), **options)
+
+    def route(self, sql):
+        """(SQL to run, rollup) — the rollup rewrite when one matches and is fresh, else (sql, None)"""
+        for rollup in list(self.rollups):
+            rewritten = rollup.rewrite(sql)
+            if rewritten and self.ensure_fresh(rollup):
+                self.counters["served"] += 1
+                return rewritten, rollup
+        return sql, None
+
+    def ensure_fresh(self, rollup):
+        """Refresh the rollup incrementally if it is older than max_staleness; False if that fails"""
+        if rollup.refreshed_at is not None and time.time() - rollup.refreshed_at <= self.max_staleness:
+            return True
+        with self._locks[rollup.name]:
+            # Another thread may have refreshed it while we waited
+            if rollup.refreshed_at is not None and time.time() - rollup.refreshed_at <= self.max_staleness:
+                return True
+            try:
+                self.refresh(rollup)
+                return True
+            except Exception as e:
+                logger.warning("Rollup refresh failed for %s: %s", rollup.name, e)
+                self.counters["refresh_failures"] += 1
+                return False
+
+    def refresh(self, rollup):
+        started = time.perf_counter()
+        previous = rollup.watermark
+        with self.engine.begin() as conn:
+            watermark = rollup.refresh(conn)
+        self.counters["refreshes"] += 1
+        if watermark != previous:
+            self.counters["incremental_refreshes"] += 1
+            logger.info("Refreshed %s from %s to %s in %.3fs", rollup.name, previous, watermark, time.perf_counter() - started)
+
+    def refresh_all(self):
+        for rollup in list(self.rollups):
+            with self._locks[rollup.name]:
+                self.refresh(rollup)
+
+    def observe(self, sql, seconds):
+        """Record an executed query; hot fingerprints get a rollup built in the background"""
+        if not self.auto_create:
+            return
+        info = analyze_query(sql)
+        if info is None or not info["group_by"] or any(info["table"] == r.name for r in self.rollups):
+            return
+        fingerprint = fingerprint_sql(sql)
+        with self._lock:
+            item = self._workload.setdefault(fingerprint, {"sql": sql, "executions": 0, "total_seconds": 0.0})
+            item["executions"] += 1
+            item["total_seconds"] += seconds
+            if item["executions"] < self.hot_after or item["total_seconds"] < self.min_seconds:
+                return
+            if fingerprint in self._building or any(r.rewrite(sql) for r in self.rollups):
+                return
+            self._building.add(fingerprint)
+        threading.Thread(target=self._materialize, args=(fingerprint, item), daemon=True,
+                         name="materialize").start()
+
+    def _materialize(self, fingerprint, item):
+        try:
+            advisor = WorkloadAdvisor(self.engine, [item])
+            for recommendation in advisor.recommend():
+                if recommendation["type"] != "rollup":
+                    continue
+                rollup = recommendation["rollup"]
+                started = time.perf_counter()
+                with self._locks[rollup.name]:
+                    with self.engine.begin() as conn:
+                        rollup.build(conn)
+                with self._lock:
+                    self.rollups = [r for r in self.rollups if r.name != rollup.name] + [rollup]
+                self.counters["built"] += 1
+                logger.info("Materialized %s in %.3fs", rollup.name, time.perf_counter() - started)
+        except Exception as e:
+            logger.warning("Materializing rollup failed: %s", e)
+        finally:
+            with self._lock:
+                self._building.discard(fingerprint)
+
+    def stats(self):
+        """Rollups with their watermark and age, plus served/refresh counters"""
+        now = time.time()
+        return {
+            "rollups": [{
+                "name": rollup.name,
+                "watermark": rollup.watermark,
+                "age_seconds": None if rollup.refreshed_at is None else round(now - rollup.refreshed_at, 1)
+            } for rollup in self.rollups],
+            **self.counters
+        }
@@ -0,0 +1,216 @@
+import re
+import threading
+from collections import deque
+
+import numpy as np
+from answer_cache import normalize_question
+
+# Question words that name a measure, and the column names they may refer to
+MEASURES = {
+    "sales": ("total_amount", "amount", "revenue", "sales"),
+    "revenue": ("total_amount", "amount", "revenue", "sales"),
+    "amount": ("total_amount", "amount"),
+    "quantity": ("quantity", "qty", "units"),
+    "units": ("quantity", "qty", "units"),
+    "sold": ("quantity", "qty", "units"),
+    "price": ("price", "unit_price")
+}
+
+AGGREGATES = {"average": "AVG", "avg": "AVG", "mean": "AVG", "count": "COUNT", "number": "COUNT", "many": "COUNT"}
+
+# Words a template can safely ignore; anything else means the question says more than the template does
+FILLER = {
+    "show", "me", "list", "get", "give", "what", "are", "is", "the", "a", "an", "of", "total", "overall",
+    "all", "with", "chart", "graph", "plot", "please", "by", "per", "each", "top", "best", "selling",
+    "products", "items", "sum", "how", "much", "many", "in", "for"
+}
+
+# Signs that a question needs more than a single-table aggregate
+COMPLEX_WORDS = {
+    "compare", "comparison", "versus", "vs", "ratio", "percentage", "percent", "share", "growth", "trend",
+    "change", "difference", "correlation", "median", "rank", "cumulative", "running", "moving", "forecast",
+    "why", "except", "without", "never", "both", "between", "than", "while", "whose"
+}
+
+class TemplateMatcher:
+    """Deterministic SQL for "<measure> by <column>" and "top N <column> by <measure>" questions.
+
+    Columns are resolved against the cached schema and a template only
+    matches when every word of the question is accounted for, so anything
+    with a filter or a second condition goes to a model instead.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+
+    def match(self, question):
+        """SQL for the question, or None when no template fits"""
+        words = normalize_question(question).split()
+        if "by" not in words and "per" not in words:
+            return None
+        split = max(i for i, word in enumerate(words) if word in ("by", "per"))
+        head, tail = words[:split], words[split + 1:]
+        limit = None
+        if "top" in head or "best" in head:
+            numbers = [word for word in head if word.isdigit()]
+            limit = int(numbers[0]) if numbers else 10
+        aggregate = next((AGGREGATES[word] for word in head if word in AGGREGATES), "SUM")
+        if limit is None:
+            measure_words, dimension_words = head, tail
+        else:
+            # "top 5 products by quantity": the grouped column comes first, the measure after "by"
+            measure_words, dimension_words = tail, [word for word in head if not word.isdigit()]
+
+        matches = []
+        tables = self.schema.table_names()
+        all_table_words = {word for table in tables for word in (table.lower(), table.lower().rstrip("s"))}
+        for table in tables:
+            columns = self.schema.table(table)["columns"]
+            numeric = [column["name"] for column in columns
+                       if re.search(r"INT|REAL|NUM|DEC|FLOAT|DOUBLE|MONEY", column["type"], re.I)]
+            dimension, used = self._dimension(dimension_words, [column["name"] for column in columns])
+            measure, measure_used = self._measure(measure_words, numeric, aggregate)
+            table_words = {table.lower(), table.lower().rstrip("s")}
+            leftover = set(words) - FILLER - set(AGGREGATES) - used - measure_used - table_words - {str(limit)}
+            # "how many sales by movement type" names another table: not a question about this one
+            leftover |= set(words) & (all_table_words - table_words)
+            if dimension is None or measure is None or leftover or dimension == measure:
+                continue
+            matches.append((bool(table_words & set(words)), table, dimension, measure))
+        # Several tables fit: only the one the question names will do
+        if len(matches) > 1:
+            matches = [match for match in matches if match[0]]
+        if len(matches) != 1:
+            return None
+        _, table, dimension, measure = matches[0]
+        return self._sql(table, dimension, measure, aggregate, limit)
+
+    def _dimension(self, words, names):
+        # A column named after the word, or after the word plus a suffix (product -> product_name)
+        candidates = [word for word in words if word not in FILLER] or words
+        for first, second in zip(candidates, candidates[1:]):
+            # Two words naming one column: "movement type" -> movement_type
+            for name in names:
+                if name.lower() in (f"{first}_{second}", f"{first}{second}"):
+                    return name, {first, second}
+        for word in candidates:
+            stem = re.sub(r"s$", "", word)
+            for name in names:
+                lower = name.lower()
+                if lower in (word, stem) or lower.startswith(stem + "_") or lower.endswith("_" + stem):
+                    return name, {word}
+        return None, set()
+
+    def _measure(self, words, numeric, aggregate):
+        if aggregate == "COUNT":
+            # COUNT(*) uses no measure: "how many units" means a sum, and "how many sales" on another
+            # table is a different question, so measure words are left over unless they name the table
+            return "*", set()
+        for word in words:
+            for candidate in MEASURES.get(word, ()):
+                for name in numeric:
+                    if name.lower() == candidate:
+                        return name, {word}
+        return None, set()
+
+    def _sql(self, table, dimension, measure, aggregate, limit):
+        value = f"{aggregate}({measure})"
+        alias = {"SUM": "total", "AVG": "average", "COUNT": "count"}[aggregate]
+        sql = f"SELECT {dimension}, {value} AS {alias} FROM {table} GROUP BY {dimension}"
+        if limit is not None:
+            top = ""
+            if self.schema.engine.dialect.name == "mssql":
+                top, limit_clause = f"TOP {limit} ", ""
+            else:
+                limit_clause = f" LIMIT {limit}"
+            return f"SELECT {top}{sql[len('SELECT '):]} ORDER BY {alias} DESC{limit_clause}"
+        return f"{sql} ORDER BY {dimension}"
+
+
+class ComplexityClassifier:
+    """Scores how hard a question is to translate; below ``threshold`` it counts as simple"""
+
+    def __init__(self, table_selector=None, threshold=1.0, max_words=12):
+        self.table_selector = table_selector
+        self.threshold = threshold
+        self.max_words = max_words
+
+    def classify(self, question):
+        """("simple" or "complex", score, reasons)"""
+        words = normalize_question(question).split()
+        reasons = [word for word in words if word in COMPLEX_WORDS]
+        score = float(len(reasons))
+        if len(words) > self.max_words:
+            score += 1
+            reasons.append(f"{len(words)} words")
+        conditions = sum(word in ("and", "or", "where", "when", "only") for word in words)
+        if conditions:
+            score += 0.5 * conditions
+            reasons.append(f"{conditions} condition(s)")
+        if self.table_selector is not None:
+            # Questions that touch several tables need a join
+            tables = int((self.table_selector.scores(question) > 0).sum())
+            if tables > 1:
+                score += 0.5 * (tables - 1)
+                reasons.append(f"{tables} tables")
+        return ("simple" if score < self.threshold else "complex"), score, reasons
+
+
+class ModelRouter:
+    """Sends each question to a template, a small model or the large model, and tracks each route.
+
+    Simple questions are answered by a template when one matches, otherwise
+    by the small model (if one is configured); everything else goes to the
+    large model. SQL from the cheaper routes that fails validation is
+    repaired by the large model, which counts as an escalation.
+    """
+
+    def __init__(self, large_llm, small_llm=None, templates=None, classifier=None):
+        self.large_llm = large_llm
+        self.small_llm = small_llm
+        self.templates = templates
+        self.classifier = classifier or ComplexityClassifier()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def route(self, question):
+        """{"route", "sql" (templates only), "llm", "complexity", "reasons"} for a question"""
+        label, score, reasons = self.classifier.classify(question)
+        decision = {"route": "large", "sql": None, "llm": self.large_llm, "complexity": score, "reasons": reasons}
+        if label == "simple":
+            sql = self.templates.match(question) if self.templates is not None else None
+            if sql is not None:
+                decision.update(route="template", sql=sql, llm=self.small_llm or self.large_llm)
+            elif self.small_llm is not None:
+                decision.update(route="small", llm=self.small_llm)
+        return decision
+
+    def llm_for(self, route):
+        """Model that phrases the answer for a route"""
+        if route in ("template", "small") and self.small_llm is not None:
+            return self.small_llm
+        return self.large_llm
+
+    def record(self, route, seconds, success, escalated=False):
+        with self._lock:
+            stats = self._stats.setdefault(route, {"count": 0, "success": 0, "escalated": 0,
+                                                   "latencies": deque(maxlen=1000)})
+            stats["count"] += 1
+            stats["success"] += bool(success)
+            stats["escalated"] += bool(escalated)
+            stats["latencies"].append(seconds * 1000)
+
+    def stats(self):
+        """Per route: questions, success rate, escalations and latency percentiles"""
+        with self._lock:
+            result = {}
+            for route, stats in self._stats.items():
+                latencies = list(stats["latencies"])
+                result[route] = {
+                    "count": stats["count"],
+                    "success_rate": round(stats["success"] / stats["count"], 3),
+                    "escalated": stats["escalated"],
+                    "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+                    "p95_ms": round(float(np.percentile(latencies, 95)), 1)
+                }
+            return result
@@ -0,0 +1,215 @@
+import os
+import re
+import logging
+import math
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from sqlalchemy import event
+from answer_cache import LRUCache
+from sql_utils import KEYWORDS, tokenize_sql
+
+logger = logging.getLogger(__name__)
+
+# Default cost ceilings: estimated rows examined on SQLite, optimizer cost units on SQL Server
+DEFAULT_MAX_COST = {"sqlite": 5e7, "mssql": 500.0}
+
+PLAN_STEP = re.compile(r"^(SCAN|SEARCH) (?:TABLE )?(\S+)(?: AS \S+)?(.*)$")
+
+def table_aliases(sql):
+    """Map each alias (and table name) in FROM/JOIN clauses to its table"""
+    tokens = [(kind, value) for kind, value in tokenize_sql(sql) if kind not in ("space", "comment")]
+    aliases, in_from = {}, False
+    for i, (kind, value) in enumerate(tokens):
+        previous = tokens[i - 1][1].lower() if i else ""
+        if kind == "word" and value.lower() in ("from", "join"):
+            in_from = True
+            continue
+        if (kind == "word" and value.lower() in KEYWORDS and value.lower() != "as") or value in ("(", ")"):
+            in_from = in_from and value.lower() in ("inner", "left", "right", "full", "outer", "cross")
+            continue
+        if not in_from or kind not in ("word", "identifier") or previous not in ("from", "join", ","):
+            continue
+        table = value.strip('"[]`')
+        following = tokens[i + 1:i + 3]
+        # Schema-qualified name (dbo.sales): the table is the last part
+        while len(following) > 1 and following[0][1] == ".":
+            table = following[1][1].strip('"[]`')
+            i += 2
+            following = tokens[i + 1:i + 3]
+        aliases[table.lower()] = table
+        if following and following[0][1].lower() == "as" and len(following) > 1:
+            aliases[following[1][1].strip('"[]`').lower()] = table
+        elif following and following[0][0] in ("word", "identifier") and following[0][1].lower() not in KEYWORDS:
+            aliases[following[0][1].strip('"[]`').lower()] = table
+    return aliases
+
+
+class QueryCostError(ValueError):
+    """Raised when a query's estimated cost is over the configured ceiling"""
+
+
+class QueryTimeoutError(TimeoutError):
+    """Raised when a query runs past the statement timeout and is interrupted"""
+
+
+class QueryGuard:
+    """Pre-execution checks for generated SQL: plan-based cost estimate, statement timeout, read-only connections.
+
+    SQLite has no cost numbers in EXPLAIN QUERY PLAN, so the estimate is the
+    number of rows the nested loops would visit, from table sizes and rough
+    selectivities for index searches. SQL Server reports the optimizer's own
+    estimate through SHOWPLAN_XML.
+    """
+
+    def __init__(self, engine, max_cost=None, max_rows=None, timeout=None, read_only=True):
+        self.engine = engine
+        dialect = engine.dialect.name
+        if max_cost is None:
+            max_cost = float(os.getenv("QUERY_MAX_COST", DEFAULT_MAX_COST.get(dialect, 0))) or None
+        if max_rows is None and os.getenv("QUERY_MAX_EST_ROWS"):
+            max_rows = float(os.getenv("QUERY_MAX_EST_ROWS"))
+        if timeout is None:
+            timeout = float(os.getenv("QUERY_TIMEOUT", "30")) or None
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self.read_only = read_only
+        self.rejected = 0
+        self.timeouts = 0
+        self._table_rows = LRUCache(maxsize=256, ttl=60)
+        if read_only and dialect == "sqlite":
+            event.listen(engine, "connect", self._sqlite_query_only)
+
+    @staticmethod
+    def _sqlite_query_only(dbapi_connection, connection_record):
+        # Any write on this connection now fails with "attempt to write a readonly database"
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+
+    def check(self, sql, max_cost=None, max_rows=None):
+        """Estimate the query and raise QueryCostError if it is over a ceiling; returns the estimate.
+
+        ``max_cost`` and ``max_rows`` override the guard's ceilings for this call; 0 means none.
+        """
+        max_cost = self.max_cost if max_cost is None else max_cost or None
+        max_rows = self.max_rows if max_rows is None else max_rows or None
+        try:
+            estimate = self.estimate(sql)
+        except Exception as e:
+            # A plan that can't be produced means the query would fail anyway; let execution report it
+            logger.warning("Cost estimate failed: %s", e)
+            return None
+        if max_cost and estimate["cost"] is not None and estimate["cost"] > max_cost:
+            self.rejected += 1
+            raise QueryCostError(f"estimated cost {estimate['cost']:,.0f} {estimate['unit']} is over the limit of {max_cost:,.0f}")
+        if max_rows and estimate["rows"] is not None and estimate["rows"] > max_rows:
+            self.rejected += 1
+            raise QueryCostError(f"estimated {estimate['rows']:,.0f} rows is over the limit of {max_rows:,.0f}")
+        return estimate
+
+    def estimate(self, sql):
+        """{"cost", "rows", "unit", "plan"} for a statement, without running it"""
+        with self.engine.connect() as conn:
+            if self.engine.dialect.name == "sqlite":
+                return self._sqlite_estimate(conn, sql)
+            if self.engine.dialect.name == "mssql":
+                return self._mssql_estimate(conn, sql)
+        return {"cost": None, "rows": None, "unit": None, "plan": []}
+
+    def _sqlite_estimate(self, conn, sql):
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+        # Newer SQLite versions name steps by alias ("SCAN s") rather than by table
+        aliases = table_aliases(sql)
+        children = defaultdict(list)
+        for node_id, parent, _, detail in plan:
+            children[parent].append((node_id, detail))
+
+        def visited(parent):
+            # Sibling SCAN/SEARCH steps are nested loops: each runs once per row of the ones before it
+            total, loop_rows = 0, 1
+            for node_id, detail in children[parent]:
+                step = PLAN_STEP.match(detail)
+                if step:
+                    table = aliases.get(step.group(2).strip('"[]`').lower(), step.group(2))
+                    loop_rows *= max(self._step_rows(conn, step.group(1), table, step.group(3)), 1)
+                    total += loop_rows
+                if node_id in children:
+                    total += visited(node_id)
+            return total
+
+        return {"cost": visited(0), "rows": None, "unit": "rows examined", "plan": [row[3] for row in plan]}
+
+    def _step_rows(self, conn, kind, table, detail):
+        rows = self._sqlite_table_rows(conn, table)
+        if kind == "SCAN":
+            return rows
+        if re.search(r"PRIMARY KEY \((rowid|\w+)=\?\)", detail):
+            return 1
+        # Rough selectivities for an index search: equality 1%, range 10%
+        return math.ceil(rows * (0.01 if re.search(r"=\?", detail) and not re.search(r"[<>]", detail) else 0.1))
+
+    def _sqlite_table_rows(self, conn, table):
+        table = table.strip('"[]`')
+        rows = self._table_rows.get(table)
+        if rows is None:
+            exists = conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).scalar()
+            if not exists:
+                # A subquery or CTE; its own steps are costed separately
+                return 1000
+            try:
+                # MAX(rowid) is an index lookup, unlike COUNT(*)
+                rows = conn.exec_driver_sql(f'SELECT MAX(rowid) FROM "{table}"').scalar() or 0
+            except Exception:
+                rows = conn.exec_driver_sql(f'SELECT COUNT(*) FROM "{table}"').scalar()
+            self._table_rows.set(table, rows)
+        return rows
+
+    def _mssql_estimate(self, conn, sql):
+        conn.exec_driver_sql("SET SHOWPLAN_XML ON")
+        try:
+            plan = conn.exec_driver_sql(sql).scalar()
+        finally:
+            conn.exec_driver_sql("SET SHOWPLAN_XML OFF")
+        cost = re.search(r'StatementSubTreeCost="([^"]+)"', plan)
+        rows = re.search(r'StatementEstRows="([^"]+)"', plan)
+        return {
+            "cost": float(cost.group(1)) if cost else None,
+            "rows": float(rows.group(1)) if rows else None,
+            "unit": "cost units",
+            "plan": [plan]
+        }
+
+    @contextmanager
+    def time_limit(self, conn, timeout=None):
+        """Interrupt statements on this connection that run longer than the timeout (or ``timeout``; 0 means none)"""
+        timeout = self.timeout if timeout is None else timeout
+        if not timeout:
+            yield
+            return
+        raw = conn.connection.driver_connection
+        dialect = self.engine.dialect.name
+        if dialect == "sqlite":
+            deadline = time.monotonic() + timeout
+            # Called every 10k VM instructions; a non-zero return aborts the statement
+            raw.set_progress_handler(lambda: int(time.monotonic() > deadline), 10000)
+        elif dialect == "mssql":
+            previous = raw.timeout
+            raw.timeout = math.ceil(timeout)
+        try:
+            yield
+        except Exception as e:
+            if "interrupted" in str(e) or "HYT00" in str(e):
+                self.timeouts += 1
+                raise QueryTimeoutError(f"query stopped after {timeout:g} seconds") from e
+            raise
+        finally:
+            if dialect == "sqlite":
+                raw.set_progress_handler(None, 0)
+            elif dialect == "mssql":
+                raw.timeout = previous
+
+    def stats(self):
+        return {"max_cost": self.max_cost, "timeout": self.timeout, "read_only": self.read_only,
+                "rejected": self.rejected, "timeouts": self.timeouts}
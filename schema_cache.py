@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from sqlalchemy import MetaData, Table, inspect, select
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.types import NullType
+from index_advisor import rollup_table_names
+
+logger = logging.getLogger(__name__)
+
+# Cheap queries whose result changes whenever tables or columns change
+SCHEMA_VERSION_QUERIES = {
+    "sqlite": "PRAGMA schema_version",
+    "mssql": "SELECT CONCAT(COUNT(*), '@', MAX(modify_date)) FROM sys.objects WHERE type IN ('U', 'V')",
+    "postgresql": "SELECT COUNT(*) || '@' || COALESCE(MAX(oid::bigint), 0) FROM pg_class WHERE relkind IN ('r', 'v')",
+}
+
+class SchemaCache:
+    """Lazily reflected, fingerprinted and disk-backed table metadata"""
+
+    def __init__(self, engine, cache_dir=".schema_cache", sample_rows=3, check_interval=5):
+        self.engine = engine
+        self.sample_rows = sample_rows
+        self.check_interval = check_interval
+        self.reflections = 0
+        self._lock = threading.RLock()
+        self._fingerprint = None
+        self._checked_at = 0.0
+        self._table_names = None
+        self._tables = {}
+        self.cache_path = None
+        if cache_dir:
+            url = self.engine.url.render_as_string(hide_password=True)
+            self.cache_path = os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest()[:16] + ".json")
+            self.load()
+
+    def fingerprint(self):
+        """Identify database and schema version; drops cached tables when it changes"""
+        with self._lock:
+            now = time.monotonic()
+            if self._fingerprint is not None and now - self._checked_at < self.check_interval:
+                return self._fingerprint
+            url = self.engine.url.render_as_string(hide_password=True)
+            fingerprint = hashlib.sha1(f"{url}|{self._schema_version()}".encode()).hexdigest()
+            self._checked_at = now
+            if fingerprint != self._fingerprint:
+                if self._fingerprint is not None:
+                    logger.info("Schema changed, dropping cached table metadata")
+                    self._table_names = None
+                    self._tables = {}
+                self._fingerprint = fingerprint
+            return fingerprint
+
+    def table_names(self):
+        """Usable table names, listed once per schema version"""
+        with self._lock:
+            self.fingerprint()
+            if self._table_names is None:
+                names = inspect(self.engine).get_table_names()
+                # Rollups are only read through RollupMaterializer.route, which refreshes them first
+                hidden = rollup_table_names(self.engine)
+                self._table_names = sorted(name for name in names if not name.startswith("sqlite_") and name not in hidden)
+            return list(self._table_names)
+
+    def table(self, name):
+        """Metadata for one table, reflected on first use only"""
+        with self._lock:
+            self.fingerprint()
+            if name not in self._tables:
+                self._tables[name] = self._reflect(name)
+                self.save()
+            return self._tables[name]
+
+    def get_table_info(self, table_names=None):
+        """Table DDL plus sample rows, in the format SQLDatabase.get_table_info uses"""
+        names = table_names if table_names is not None else self.table_names()
+        missing = set(names).difference(self.table_names())
+        if missing:
+            raise ValueError(f"table_names {missing} not found in database")
+        return "\n\n".join(self.table(name)["info"] for name in names)
+
+    def load(self):
+        """Warm start from disk when the stored fingerprint still matches"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable schema cache: %s", e)
+            return False
+        with self._lock:
+            if cached.get("fingerprint") != self.fingerprint():
+                return False
+            self._table_names = cached.get("table_names")
+            self._tables = cached.get("tables", {})
+            return True
+
+    def save(self):
+        """Persist the tables reflected so far"""
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": self._fingerprint, "table_names": self._table_names,
+                           "tables": self._tables}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning("Schema cache not saved: %s", e)
+
+    def _schema_version(self):
+        query = SCHEMA_VERSION_QUERIES.get(self.engine.dialect.name)
+        with self.engine.connect() as conn:
+            if query:
+                return conn.exec_driver_sql(query).scalar()
+            # Fall back to the table list when there is no catalog version to read
+            return ",".join(sorted(inspect(conn).get_table_names()))
+
+    def _reflect(self, name):
+        self.reflections += 1
+        table = Table(name, MetaData(), autoload_with=self.engine)
+        for column in list(table.columns):
+            if type(column.type) is NullType:
+                table._columns.remove(column)
+        columns = [
+            {"name": column.name, "type": str(column.type), "nullable": column.nullable,
+             "primary_key": column.primary_key, "comment": column.comment}
+            for column in table.columns
+        ]
+        info = str(CreateTable(table).compile(self.engine)).rstrip()
+        if self.sample_rows:
+            info += f"\n\n/*\n{self._sample_rows(table)}\n*/"
+        return {"name": name, "columns": columns, "info": info}
+
+    def _sample_rows(self, table):
+        columns_str = "\t".join(column.name for column in table.columns)
+        try:
+            with self.engine.connect() as conn:
+                rows = conn.execute(select(table).limit(self.sample_rows))
+                rows_str = "\n".join("\t".join(str(value)[:100] for value in row) for row in rows)
+        except Exception:
+            rows_str = ""
+        return f"{self.sample_rows} rows from {table.name} table:\n{columns_str}\n{rows_str}"
@@ -0,0 +1,67 @@
+import threading
+
+class Flight:
+    """One in-flight computation that other callers can wait on"""
+
+    def __init__(self):
+        self.finished = threading.Event()
+        self.result = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one computation.
+
+    The first caller for a key becomes the leader and runs the work; callers
+    arriving while it is in flight wait for the leader's result instead of
+    repeating it. A leader that gives up (error, cancellation) finishes with
+    ``None`` and its waiters run the work themselves.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+
+    def begin(self, key):
+        """(flight, is_leader) for this key"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight()
+                self.leaders += 1
+                return flight, True
+            flight.waiters += 1
+            return flight, False
+
+    def wait(self, flight, timeout=None):
+        """The leader's result, or None if it gave up or the wait timed out"""
+        flight.finished.wait(timeout)
+        with self._lock:
+            if flight.result is None:
+                self.fallbacks += 1
+            else:
+                self.coalesced += 1
+        return flight.result
+
+    def finish(self, key, flight, result=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.result = result
+        flight.finished.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "fallbacks": self.fallbacks
+            }
+
+
+# Shared by every agent in the process, so sessions asking the same question share one run
+single_flight = SingleFlight()
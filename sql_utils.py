@@ -0,0 +1,114 @@
+import re
+import hashlib
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<identifier>"(?:[^"]|"")*"|\[[^\]]*\]|`[^`]*`)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_@#][A-Za-z0-9_@#$]*)
+  | (?P<space>\s+)
+  | (?P<symbol><>|<=|>=|!=|\|\||::|.)
+""", re.VERBOSE | re.DOTALL)
+
+KEYWORDS = {
+    "select", "from", "where", "group", "by", "order", "having", "limit", "offset", "top", "distinct",
+    "as", "and", "or", "not", "in", "is", "null", "like", "between", "join", "inner", "left", "right",
+    "full", "outer", "cross", "on", "union", "all", "with", "case", "when", "then", "else", "end",
+    "asc", "desc", "sum", "count", "avg", "min", "max", "over", "partition", "fetch", "next", "rows",
+    "only", "exists", "intersect", "except", "cast"
+}
+
+FUNCTION_KEYWORDS = {"sum", "count", "avg", "min", "max", "cast"}
+
+# Statements (and SELECT ... INTO) that change data, schema or server state
+FORBIDDEN_KEYWORDS = {
+    "insert", "update", "delete", "merge", "drop", "alter", "create", "truncate", "grant", "revoke",
+    "exec", "execute", "attach", "detach", "pragma", "vacuum", "reindex", "into", "call", "commit",
+    "rollback", "begin", "declare", "shutdown", "kill", "backup", "restore", "bulk", "openrowset"
+}
+
+class UnsafeSQLError(ValueError):
+    """Raised when generated SQL is not a single read-only SELECT"""
+
+
+def tokenize_sql(sql):
+    """Split SQL into (kind, text) tokens, keeping strings, identifiers and comments whole"""
+    return [(match.lastgroup, match.group(0)) for match in TOKEN_PATTERN.finditer(sql)]
+
+def split_statements(sql):
+    """Split on semicolons outside strings, identifiers and comments"""
+    statements, current = [], []
+    for kind, value in tokenize_sql(sql):
+        if kind == "symbol" and value == ";":
+            statements.append("".join(current).strip())
+            current = []
+        else:
+            current.append(value)
+    statements.append("".join(current).strip())
+    return [statement for statement in statements if _code_tokens(statement)]
+
+def extract_sql(text):
+    """Pull the full SQL statement out of an LLM reply (fences, labels and prose removed)"""
+    fenced = re.search(r"```(?:sql)?\s*(.*?)```", text, re.IGNORECASE | re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    if "SQLQuery:" in text:
+        text = text.split("SQLQuery:", 1)[1]
+    text = text.split("SQLResult:", 1)[0]
+    match = re.search(r"(?im)^\s*(select|with)\b", text) or re.search(r"(?i)\b(select|with)\b", text)
+    if match:
+        text = text[match.start():]
+    # Stop at the first paragraph that reads as prose rather than SQL
+    paragraphs = re.split(r"\n\s*\n", text)
+    kept = paragraphs[:1]
+    for paragraph in paragraphs[1:]:
+        first = _code_tokens(paragraph)[:1]
+        if not first or (first[0][0] == "word" and first[0][1].lower() not in KEYWORDS):
+            break
+        kept.append(paragraph)
+    text = "\n\n".join(kept)
+    statements = split_statements(text)
+    return statements[0] if statements else text.strip()
+
+def normalize_sql(sql):
+    """Canonical form: comments dropped, whitespace collapsed, keywords uppercased"""
+    normalized = ""
+    previous = None
+    for kind, value in _code_tokens(sql):
+        is_call = value == "(" and previous is not None and previous[0] in ("word", "identifier") \
+            and (previous[1].lower() not in KEYWORDS or previous[1].lower() in FUNCTION_KEYWORDS)
+        if kind == "word" and value.lower() in KEYWORDS:
+            value = value.upper()
+        if normalized and not (value in ",)." or is_call or normalized.endswith(("(", "."))):
+            normalized += " "
+        normalized += value
+        previous = (kind, value)
+    return normalized.rstrip(";").strip()
+
+def fingerprint_sql(sql):
+    """Hash of the normalized statement with literals replaced, for grouping query metrics"""
+    parts = []
+    for kind, value in _code_tokens(sql):
+        if kind in ("string", "number"):
+            value = "?"
+        elif kind == "word" or kind == "identifier":
+            value = value.lower()
+        parts.append(value)
+    return hashlib.sha1(" ".join(parts).encode()).hexdigest()[:16]
+
+def ensure_select(sql):
+    """Reject anything but a single SELECT (or WITH ... SELECT) statement"""
+    statements = split_statements(sql)
+    if len(statements) != 1:
+        raise UnsafeSQLError(f"Expected exactly one SQL statement, got {len(statements)}")
+    words = [value.lower() for kind, value in _code_tokens(statements[0]) if kind == "word"]
+    if not words or words[0] not in ("select", "with"):
+        raise UnsafeSQLError("Only SELECT queries are allowed")
+    forbidden = sorted(FORBIDDEN_KEYWORDS.intersection(words))
+    if forbidden:
+        raise UnsafeSQLError(f"Only read-only queries are allowed (found {', '.join(forbidden).upper()})")
+    return statements[0]
+
+def _code_tokens(sql):
+    return [(kind, value) for kind, value in tokenize_sql(sql) if kind not in ("space", "comment")]
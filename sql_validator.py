@@ -0,0 +1,130 @@
+import re
+import difflib
+import threading
+from query_guard import table_aliases
+from sql_utils import KEYWORDS, tokenize_sql
+
+CTE_NAME = re.compile(r"""(?i)(?:\bwith\b(?:\s+recursive)?|,)\s*("[^"]+"|\[[^\]]+\]|`[^`]+`|\w+)\s*(?:\([^)]*\)\s*)?as\s*\(""")
+
+# Words that are not columns even though they aren't SQL keywords we tokenize as such
+NON_COLUMNS = {
+    "true", "false", "current_date", "current_time", "current_timestamp", "escape", "nulls", "first", "last",
+    "glob", "regexp", "collate", "nocase", "recursive", "year", "quarter", "month", "week", "day", "hour",
+    "minute", "second", "dd", "mm", "yy", "yyyy", "wk", "qq", "ties", "percent", "interval", "filter", "within"
+}
+
+class SQLValidationError(ValueError):
+    """Raised when generated SQL still fails validation after the allowed repairs"""
+
+    def __init__(self, message, attempts=None):
+        super().__init__(message)
+        self.attempts = attempts or []
+
+
+class SQLValidator:
+    """Cheap checks of generated SQL before it runs.
+
+    References are checked against the cached schema first (unknown tables,
+    unknown ``alias.column``), without a round trip. Then the database compiles
+    the statement without running it (EXPLAIN, or SHOWPLAN_XML on SQL Server),
+    which catches syntax errors and unqualified unknown columns; close matches
+    from the schema are added to its error as hints for the repair prompt.
+    """
+
+    def __init__(self, engine, schema):
+        self.engine = engine
+        self.schema = schema
+        self.checked = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def validate(self, sql):
+        """Problems found in the statement, as messages for the LLM; empty when it is valid"""
+        problems = self.check_schema(sql)
+        if not problems:
+            error = self.compile_error(sql)
+            if error:
+                problems = [error] + self._hints(sql)
+        with self._lock:
+            self.checked += 1
+            self.failed += bool(problems)
+        return problems
+
+    def check_schema(self, sql):
+        """Unknown tables and unknown qualified columns, from the cached schema"""
+        tables = {name.lower(): name for name in self.schema.table_names()}
+        derived = {name.strip('"[]`').lower() for name in CTE_NAME.findall(sql)}
+        aliases = table_aliases(sql)
+        problems = []
+        for table in sorted(set(aliases.values())):
+            if table.lower() not in tables and table.lower() not in derived:
+                problems.append(f"no such table: {table}{self._suggest(table, tables.values())}")
+        if problems:
+            return problems
+        tokens = [(kind, value) for kind, value in tokenize_sql(sql) if kind not in ("space", "comment")]
+        for i in range(len(tokens) - 2):
+            if tokens[i + 1][1] != "." or tokens[i + 2][0] not in ("word", "identifier"):
+                continue
+            table = aliases.get(tokens[i][1].strip('"[]`').lower())
+            column = tokens[i + 2][1].strip('"[]`')
+            if table is None or table.lower() not in tables or column == "*":
+                continue
+            columns = self._columns(tables[table.lower()])
+            if column.lower() not in {name.lower() for name in columns}:
+                problems.append(f"no such column: {tokens[i][1]}.{column} (table {table} has "
+                                f"{', '.join(columns)}){self._suggest(column, columns)}")
+        return sorted(set(problems))
+
+    def compile_error(self, sql):
+        """The database's error for the statement, compiled but not run, or None"""
+        dialect = self.engine.dialect.name
+        try:
+            with self.engine.connect() as conn:
+                if dialect == "mssql":
+                    conn.exec_driver_sql("SET SHOWPLAN_XML ON")
+                    try:
+                        conn.exec_driver_sql(sql).fetchall()
+                    finally:
+                        conn.exec_driver_sql("SET SHOWPLAN_XML OFF")
+                else:
+                    # SQLite's EXPLAIN only compiles the statement to bytecode
+                    conn.exec_driver_sql(f"EXPLAIN {sql}").fetchall()
+        except Exception as e:
+            error = getattr(e, "orig", None) or e
+            return str(error).strip().splitlines()[0]
+        return None
+
+    def stats(self):
+        return {"checked": self.checked, "failed": self.failed}
+
+    def _columns(self, table):
+        return [column["name"] for column in self.schema.table(table)["columns"]]
+
+    def _hints(self, sql):
+        # Unqualified words that aren't columns of the referenced tables, with their closest column
+        tables = {name.lower(): name for name in self.schema.table_names()}
+        referenced = [tables[table.lower()] for table in set(table_aliases(sql).values()) if table.lower() in tables]
+        columns = [column for table in referenced for column in self._columns(table)]
+        known = {name.lower() for name in columns} | set(table_aliases(sql)) | KEYWORDS | NON_COLUMNS
+        known |= {name.strip('"[]`').lower() for name in CTE_NAME.findall(sql)}
+        tokens = [(kind, value) for kind, value in tokenize_sql(sql) if kind not in ("space", "comment")]
+        known |= {tokens[i + 1][1].strip('"[]`').lower() for i in range(len(tokens) - 1) if tokens[i][1].lower() == "as"}
+        hints = []
+        for i, (kind, value) in enumerate(tokens):
+            word = value.strip('"[]`')
+            previous = tokens[i - 1][1].lower() if i else ""
+            following = tokens[i + 1][1] if i + 1 < len(tokens) else ""
+            if kind not in ("word", "identifier") or word.lower() in known or previous in ("as", ".") \
+                    or following in ("(", "."):
+                continue
+            suggestion = self._suggest(word, columns)
+            if suggestion and f"{word}{suggestion}" not in hints:
+                hints.append(f"{word}{suggestion}")
+        return [f"unknown name {hint}" for hint in hints]
+
+    @staticmethod
+    def _suggest(name, candidates):
+        close = difflib.get_close_matches(name.lower(), [c.lower() for c in candidates], n=1, cutoff=0.6)
+        if not close:
+            return ""
+        return f" (did you mean {next(c for c in candidates if c.lower() == close[0])}?)"
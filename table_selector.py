@@ -0,0 +1,107 @@
+import re
+import math
+import threading
+from collections import Counter
+
+import numpy as np
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+def count_tokens(text):
+    """Prompt tokens for text (tiktoken when available, ~4 chars per token otherwise)"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4
+
+def tokenize(text):
+    """Split identifiers and prose into lowercase, lightly stemmed terms"""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    terms = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if len(word) > 4:
+            word = re.sub(r"(ing|es|s)$", "", word)
+        terms.append(word)
+    return terms
+
+
+class TableSelector:
+    """Pick the tables relevant to a question with BM25 over schema metadata"""
+
+    def __init__(self, schema, top_k=3, embedder=None, embedding_weight=1.0, k1=1.5, b=0.75):
+        self.schema = schema
+        self.top_k = top_k
+        self.embedder = embedder
+        self.embedding_weight = embedding_weight
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._fingerprint = None
+
+    def select(self, question):
+        """Names of the top-k tables for the question (all tables if nothing matches)"""
+        self._ensure_index()
+        if len(self._names) <= self.top_k:
+            return list(self._names)
+        scores = self.scores(question)
+        ranked = sorted(range(len(self._names)), key=lambda i: -scores[i])
+        if scores[ranked[0]] <= 0:
+            return list(self._names)
+        return sorted(self._names[i] for i in ranked[:self.top_k] if scores[i] > 0)
+
+    def tokens_saved(self, selected):
+        """Prompt tokens not sent because the other tables were left out"""
+        self._ensure_index()
+        return sum(count for name, count in self._token_counts.items() if name not in selected)
+
+    def scores(self, question):
+        """BM25 score per table, plus cosine similarity when an embedder is set"""
+        self._ensure_index()
+        scores = np.zeros(len(self._names))
+        for term in set(tokenize(question)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for i, doc in enumerate(self._docs):
+                tf = doc.get(term, 0)
+                if tf:
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / self._avg_length)
+                    scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        if self.embedder is not None and self._vectors is not None:
+            query_vector = np.asarray(self.embedder.embed_query(question))
+            scores += self.embedding_weight * (self._vectors @ query_vector)
+        return scores
+
+    def _ensure_index(self):
+        fingerprint = self.schema.fingerprint()
+        with self._lock:
+            if fingerprint == self._fingerprint:
+                return
+            names = self.schema.table_names()
+            texts = []
+            self._token_counts = {}
+            for name in names:
+                table = self.schema.table(name)
+                self._token_counts[name] = count_tokens(table["info"])
+                parts = [name, name]  # weight the table name above its columns
+                for column in table["columns"]:
+                    parts.append(column["name"])
+                    if column.get("comment"):
+                        parts.append(column["comment"])
+                texts.append(" ".join(parts))
+            self._docs = [Counter(tokenize(text)) for text in texts]
+            self._lengths = [sum(doc.values()) for doc in self._docs]
+            self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 1.0
+            doc_freq = Counter(term for doc in self._docs for term in doc)
+            self._idf = {
+                term: math.log(1 + (len(names) - df + 0.5) / (df + 0.5))
+                for term, df in doc_freq.items()
+            }
+            self._vectors = None
+            if self.embedder is not None and texts:
+                self._vectors = np.array([self.embedder.embed_query(text) for text in texts])
+            self._names = names
+            self._fingerprint = fingerprint
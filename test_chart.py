@@ -1,3 +1,4 @@
+import asyncio
 from ai_agent import DatabaseAIAgent
 import pandas as pd
 
@@ -11,13 +12,16 @@ test_questions = [
     "Show me total sales this month"
 ]
 
-for question in test_questions:
+# Questions run concurrently; responses come back in the same order
+responses = asyncio.run(agent.aquery_many(test_questions, concurrency=3, timeout=60))
+
+for question, response in zip(test_questions, responses):
     print(f"\nTesting: {question}")
-    response = agent.query(question)
     
     if response["success"]:
         print(f"Answer: {response['answer']}")
         print(f"SQL: {response['sql_query']}")
+        print(f"DB executions: {response['executions']}")
         
         if response.get("chart_data") is not None:
             print(f"Chart data shape: {response['chart_data'].shape}")
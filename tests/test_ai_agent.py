@@ -0,0 +1,93 @@
+import pytest
+
+# The agent needs the LangChain SQL packages from requirements.txt
+pytest.importorskip("langchain.sql_database")
+pytest.importorskip("langchain_experimental")
+
+from sqlalchemy import create_engine, text
+from ai_agent import DatabaseAIAgent
+from example_store import ExampleStore
+from fake_llm import ScriptedChatModel
+
+SALES_BY_PRODUCT = "SELECT product_name, SUM(total_amount) AS total FROM sales GROUP BY product_name"
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "agent.db"
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE sales (id INTEGER PRIMARY KEY, date TEXT, product_name TEXT, "
+                          "quantity INTEGER, price REAL, total_amount REAL)"))
+        conn.execute(text("INSERT INTO sales (date, product_name, quantity, price, total_amount) "
+                          "VALUES (:date, :product, :quantity, :price, :quantity * :price)"),
+                     [{"date": f"2025-01-{day:02d}", "product": product, "quantity": day, "price": price}
+                      for day in range(1, 11) for product, price in (("Laptop", 900.0), ("Mouse", 20.0))])
+    engine.dispose()
+    return path
+
+def make_agent(db_path, llm, **options):
+    options.setdefault("routing", False)
+    return DatabaseAIAgent(str(db_path), use_cache=False, llm=llm, example_store=ExampleStore(),
+                           schema_cache_dir=str(db_path.parent / "schema"), **options)
+
+def test_stream_order_and_single_execution(db_path):
+    llm = ScriptedChatModel(sql_by_question={"by product": SALES_BY_PRODUCT})
+    agent = make_agent(db_path, llm)
+    events = list(agent.stream_query("Show me sales by product"))
+    kinds = [event["type"] for event in events]
+    assert kinds[:2] == ["sql", "rows"] and kinds[-1] == "done"
+    assert set(kinds[2:-1]) == {"token"} and len(kinds[2:-1]) > 1
+    response = events[-1]["response"]
+    assert response["success"] and response["executions"] == 1 and agent.execution_count == 1
+    assert len(events[1]["data"]) == 2
+    assert "".join(event["text"] for event in events if event["type"] == "token").strip() == response["answer"]
+
+def test_invalid_sql_is_repaired(db_path):
+    llm = ScriptedChatModel(sql_by_question={"by product": "SELECT product, SUM(total_amount) FROM sales GROUP BY product"},
+                            repair_by_error={"no such column": SALES_BY_PRODUCT})
+    response = make_agent(db_path, llm).query("Show me sales by product")
+    assert response["success"] and response["sql_query"] == SALES_BY_PRODUCT
+    assert response["repairs"] == 1
+    assert [bool(attempt["problems"]) for attempt in response["attempts"]] == [True, False]
+    assert all(attempt["prompt_tokens"] > 0 for attempt in response["attempts"])
+    assert response["executions"] == 1
+
+def test_execution_error_is_repaired(db_path):
+    llm = ScriptedChatModel(sql_by_question={"overflow": "SELECT product_name, abs(-9223372036854775808) AS x FROM sales"},
+                            repair_by_error={"integer overflow": SALES_BY_PRODUCT})
+    response = make_agent(db_path, llm).query("Show the overflow by product")
+    assert response["success"] and response["repairs"] == 1
+    assert response["attempts"][0]["problems"] == ["integer overflow"]
+
+def test_repairs_are_bounded(db_path):
+    bad = "SELECT product, SUM(total_amount) FROM sales GROUP BY product"
+    llm = ScriptedChatModel(sql_by_question={"by product": bad}, repair_by_error={"no such column": bad})
+    agent = make_agent(db_path, llm, max_repairs=1)
+    response = agent.query("Show me sales by product")
+    assert not response["success"]
+    assert len(response["attempts"]) == 2 and response["repairs"] == 1
+    # One generation and one repair; no answer call and nothing sent to the database
+    assert llm.calls == 2 and response["executions"] == 0
+
+def test_template_route_skips_sql_generation(db_path):
+    llm = ScriptedChatModel()
+    response = make_agent(db_path, llm, routing=True).query("Show me sales by product")
+    assert response["success"] and response["route"] == "template"
+    assert response["sql_query"].startswith("SELECT product_name, SUM(total_amount) AS total FROM sales")
+    # Only the answer came from the model
+    assert llm.calls == 1
+
+def test_repeated_question_is_stored_as_one_example(db_path):
+    store = ExampleStore(path=str(db_path.parent / "examples.jsonl"))
+    llm = ScriptedChatModel(sql_by_question={"by product": SALES_BY_PRODUCT})
+    agent = DatabaseAIAgent(str(db_path), use_cache=False, llm=llm, example_store=store, routing=False,
+                            schema_cache_dir=str(db_path.parent / "schema"))
+    for _ in range(5):
+        assert agent.query("Show me sales by product")["success"]
+    with open(store.path) as f:
+        assert len(f.readlines()) == 1
+
+def test_top_cannot_cap_every_branch():
+    assert DatabaseAIAgent._top_cannot_cap("WITH x AS (SELECT 1 AS a) SELECT a FROM x")
+    assert DatabaseAIAgent._top_cannot_cap("SELECT a FROM t UNION ALL SELECT a FROM u")
+    assert not DatabaseAIAgent._top_cannot_cap("SELECT a FROM t WHERE a IN (SELECT a FROM u UNION SELECT 1)")
@@ -0,0 +1,75 @@
+import pytest
+from sqlalchemy import create_engine, text
+from answer_cache import AnswerCache, HashingEmbedder, key_terms, normalize_question, sqlite_data_version
+
+RESPONSE = {"answer": "Laptop, Mouse, Keyboard, Monitor and Headphones", "sql_query": "SELECT 1"}
+
+@pytest.fixture
+def cache():
+    cache = AnswerCache(embedder=HashingEmbedder())
+    cache.put("Top 5 selling products", "schema", RESPONSE)
+    return cache
+
+def test_normalize_question_spells_numbers_as_digits():
+    assert normalize_question("Top FIVE selling products?") == "top 5 selling products"
+
+def test_exact_question_hits():
+    cache = AnswerCache()
+    cache.put("Show me sales by product", "schema", RESPONSE)
+    assert cache.get("show me sales by product!", "schema") is RESPONSE
+    assert cache.get("Show me sales by product", "other schema") is None
+
+@pytest.mark.parametrize("paraphrase", ["five best sellers", "Show me the top five selling products", "5 best selling products"])
+def test_paraphrase_hits(cache, paraphrase):
+    assert cache.get(paraphrase, "schema") is RESPONSE
+    assert cache.similar_hits == 1
+
+@pytest.mark.parametrize("question", ["Bottom 5 selling products", "Top 10 selling products", "Top 5 customers by region"])
+def test_meaning_changing_edit_misses(cache, question):
+    assert cache.get(question, "schema") is None
+
+def test_threshold_separates_paraphrases_from_other_questions():
+    embedder = HashingEmbedder()
+    score = lambda a, b: float(embedder.embed_query(a) @ embedder.embed_query(b))
+    threshold = AnswerCache().similarity_threshold
+    assert score("Top 5 selling products", "five best sellers") >= threshold
+    assert score("Daily revenue trend", "revenue trend by day") >= threshold
+    assert score("Show me sales by product", "Show me sales by region") < threshold
+    assert score("Show me sales by product", "Show me quantity by product") < threshold
+
+def test_key_terms():
+    assert key_terms("Top 5 selling products") == key_terms("five best sellers")
+    assert key_terms("Daily revenue trend") != key_terms("Monthly revenue trend")
+
+def test_lru_eviction():
+    cache = AnswerCache(maxsize=2)
+    for question in ("a", "b", "c"):
+        cache.put(question, "schema", {"answer": question})
+    assert cache.get("a", "schema") is None
+    assert cache.get("c", "schema") == {"answer": "c"}
+
+def test_sqlite_data_version_changes_on_commit(tmp_path):
+    path = tmp_path / "data.db"
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE sales (amount REAL)"))
+    before = sqlite_data_version(str(path))
+    # Reading doesn't change it, and a second engine sees the same value
+    with create_engine(f"sqlite:///{path}").connect() as conn:
+        conn.execute(text("SELECT * FROM sales")).fetchall()
+    assert sqlite_data_version(str(path)) == before
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO sales VALUES (1)"))
+    assert sqlite_data_version(str(path)) != before
+    assert sqlite_data_version(str(tmp_path / "missing.db")) is None
+
+def test_sqlite_data_version_changes_on_commit_in_wal_mode(tmp_path):
+    path = tmp_path / "wal.db"
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+        conn.execute(text("CREATE TABLE sales (amount REAL)"))
+    before = sqlite_data_version(str(path))
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO sales VALUES (1)"))
+    assert sqlite_data_version(str(path)) != before
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+from chart_prep import lttb, top_n_with_other
+
+def test_lttb_keeps_endpoints_and_spikes():
+    x = np.arange(10000)
+    y = np.zeros(10000)
+    y[4321] = 100.0
+    keep = lttb(x, y, 200)
+    assert len(keep) == 200
+    assert keep[0] == 0 and keep[-1] == 9999
+    assert 4321 in keep
+    assert np.all(np.diff(keep) > 0)
+
+def test_lttb_returns_everything_when_small():
+    assert list(lttb([1, 2, 3], [3, 2, 1], 10)) == [0, 1, 2]
+
+def test_top_n_with_other_folds_the_tail():
+    data = pd.DataFrame({"product": list("abcdef"), "sales": [1, 50, 3, 40, 2, 30]})
+    result = top_n_with_other(data, "product", "sales", n=3)
+    assert list(result["product"]) == ["b", "d", "Other"]
+    assert result["sales"].sum() == data["sales"].sum()
+
+def test_top_n_with_other_keeps_order_when_few_categories():
+    data = pd.DataFrame({"product": ["b", "a", "b"], "sales": [1, 2, 3]})
+    result = top_n_with_other(data, "product", "sales", n=3)
+    assert list(result["product"]) == ["b", "a"] and list(result["sales"]) == [4, 2]
+
+def test_top_n_with_other_counts_rows():
+    data = pd.DataFrame({"type": ["in", "out", "in", "adjust"]})
+    result = top_n_with_other(data, "type", "count", n=2)
+    assert dict(zip(result["type"], result["count"])) == {"in": 2, "Other": 2}
@@ -0,0 +1,25 @@
+from example_store import ExampleStore
+
+SQL = "SELECT product_name, SUM(quantity) AS units FROM sales GROUP BY product_name"
+
+def lines(path):
+    with open(path) as f:
+        return f.readlines()
+
+def test_same_sql_is_stored_once(tmp_path):
+    path = tmp_path / "examples.jsonl"
+    store = ExampleStore(path=str(path))
+    for _ in range(5):
+        store.add("Units sold per product", "db", SQL, 0.1)
+    assert len(lines(path)) == 1
+    store.add("Units sold per product", "db", SQL + " ORDER BY units DESC", 0.1)
+    assert len(lines(path)) == 2
+    assert ExampleStore(path=str(path)).match("units sold per product?", "db")["sql"].endswith("DESC")
+
+def test_only_the_exact_question_reuses_sql():
+    store = ExampleStore()
+    store.add("Top 5 products by quantity", "db", SQL, 0.1)
+    assert store.match("top five products by quantity", "db")["sql"] == SQL
+    assert store.match("Bottom 5 products by quantity", "db") is None
+    similar = store.similar("Bottom 5 products by quantity", "db")
+    assert similar and similar[0][1]["sql"] == SQL
@@ -0,0 +1,26 @@
+import pandas as pd
+from history_store import ChatHistoryStore
+
+def response(rows, aggregated=None):
+    data = pd.DataFrame({"date": [f"2025-01-{i % 28 + 1:02d}" for i in range(rows)], "revenue": range(rows)})
+    return {"success": True, "answer": "ok", "chart_data": data, "chart_data_aggregated": aggregated}
+
+def test_result_sets_are_kept_out_of_the_metadata(tmp_path):
+    history = ChatHistoryStore(spill_dir=str(tmp_path), memory_budget_mb=64)
+    aggregated = pd.DataFrame({"date": ["2025-01-01"], "revenue": [10]})
+    index = history.append("Daily revenue trend", response(100, aggregated))
+    _, _, meta = history.latest()
+    assert "chart_data" not in meta and "chart_data_aggregated" not in meta
+    assert meta["has_chart"]
+    assert history.get_data(index).shape == (100, 2)
+    pd.testing.assert_frame_equal(history.get_data(index, "chart_data_aggregated"), aggregated)
+
+def test_frames_over_budget_are_reloaded_from_disk(tmp_path):
+    history = ChatHistoryStore(spill_dir=str(tmp_path), memory_budget_mb=0.01)
+    aggregated = pd.DataFrame({"date": ["2025-01-01"], "revenue": [10]})
+    first = history.append("first", response(1000, aggregated))
+    history.append("second", response(1000))
+    assert len(history.get_data(first)) == 1000
+    assert len(history.get_data(first, "chart_data_aggregated")) == 1
+    assert history.loads == 2
+    assert history.get_data(1, "chart_data_aggregated") is None
@@ -0,0 +1,83 @@
+import time
+import threading
+import pytest
+from job_queue import JobQueue, QueueFullError
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def answer(name, order, gate=None):
+    def run():
+        if gate is not None:
+            gate.wait(5)
+        order.append(name)
+        yield {"type": "token", "text": name}
+        yield {"type": "done", "response": {"answer": name}}
+    return run
+
+def blocked_queue():
+    """One worker, busy with a job until the returned event is set"""
+    queue, order, gate = JobQueue(workers=1), [], threading.Event()
+    blocker = queue.submit("someone", "blocker", answer("blocker", order, gate))
+    wait_until(lambda: blocker.status == "running")
+    return queue, order, gate
+
+def test_users_are_served_round_robin():
+    queue, order, gate = blocked_queue()
+    jobs = [queue.submit(user, name, answer(name, order)) for user, name in
+            [("alice", "a1"), ("alice", "a2"), ("alice", "a3"), ("bob", "b1")]]
+    gate.set()
+    wait_until(lambda: all(job.done for job in jobs))
+    assert order == ["blocker", "a1", "b1", "a2", "a3"]
+    assert jobs[0].response == {"answer": "a1"} and jobs[0].answer_so_far() == "a1"
+
+def test_per_user_limit():
+    queue, order, gate = blocked_queue()
+    queue.max_queued_per_user = 2
+    queue.submit("alice", "a1", answer("a1", order))
+    queue.submit("alice", "a2", answer("a2", order))
+    with pytest.raises(QueueFullError):
+        queue.submit("alice", "a3", answer("a3", order))
+    queue.submit("bob", "b1", answer("b1", order))
+    gate.set()
+    assert queue.metrics()["rejected"] == 1
+
+def test_cancel_queued_job_never_runs():
+    queue, order, gate = blocked_queue()
+    job = queue.submit("alice", "a1", answer("a1", order))
+    assert queue.cancel(job.id)
+    gate.set()
+    wait_until(lambda: order == ["blocker"] and queue.metrics()["running"] == 0)
+    assert job.status == "cancelled" and job.response is None
+
+def test_cancel_running_job_stops_at_next_event():
+    queue, proceed, steps = JobQueue(workers=1), threading.Event(), []
+
+    def run():
+        yield {"type": "token", "text": "partial"}
+        proceed.wait(5)
+        steps.append("second token")
+        yield {"type": "token", "text": " more"}
+        steps.append("answer")
+        yield {"type": "done", "response": {"answer": "partial more"}}
+
+    job = queue.submit("alice", "slow", run)
+    wait_until(lambda: job.events)
+    assert queue.cancel(job.id)
+    proceed.set()
+    wait_until(lambda: job.done)
+    assert job.status == "cancelled" and job.response is None
+    assert "answer" not in steps
+    assert not queue.cancel(job.id)
+
+def test_collect_hands_over_the_result_once():
+    queue, order = JobQueue(workers=1), []
+    job = queue.submit("alice", "a1", answer("a1", order))
+    wait_until(lambda: job.done)
+    assert queue.collect(job.id) == {"answer": "a1"}
+    assert job.events == [] and job.response is None
+    assert queue.get(job.id).status == "done"
+    assert queue.collect(job.id) is None
@@ -0,0 +1,40 @@
+import pytest
+from sqlalchemy import create_engine, text
+from schema_cache import SchemaCache
+from model_router import ComplexityClassifier, ModelRouter, TemplateMatcher
+
+@pytest.fixture
+def matcher(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'router.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE sales (id INTEGER PRIMARY KEY, date TEXT, product_name TEXT, "
+                          "quantity INTEGER, price REAL, total_amount REAL)"))
+        conn.execute(text("CREATE TABLE stock (id INTEGER PRIMARY KEY, date TEXT, product_name TEXT, "
+                          "movement_type TEXT, quantity INTEGER)"))
+    return TemplateMatcher(SchemaCache(engine, cache_dir=str(tmp_path / "schema")))
+
+@pytest.mark.parametrize("question, sql", [
+    ("Show me sales by product",
+     "SELECT product_name, SUM(total_amount) AS total FROM sales GROUP BY product_name ORDER BY product_name"),
+    ("how many sales by product",
+     "SELECT product_name, COUNT(*) AS count FROM sales GROUP BY product_name ORDER BY product_name"),
+    ("quantity by movement type",
+     "SELECT movement_type, SUM(quantity) AS total FROM stock GROUP BY movement_type ORDER BY movement_type"),
+])
+def test_template_matches(matcher, question, sql):
+    assert matcher.match(question) == sql
+
+@pytest.mark.parametrize("question", [
+    "how many sales by movement type",
+    "how many units by movement type",
+    "sales by product in 2025",
+    "Daily revenue trend",
+])
+def test_questions_the_templates_do_not_cover(matcher, question):
+    assert matcher.match(question) is None
+
+def test_router_sends_hard_questions_to_the_large_model(matcher):
+    router = ModelRouter("large", "small", templates=matcher, classifier=ComplexityClassifier())
+    assert router.route("Show me sales by product")["route"] == "template"
+    assert router.route("how many sales by movement type")["route"] == "small"
+    assert router.route("Compare revenue growth between laptops and mice")["route"] == "large"
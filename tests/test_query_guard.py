@@ -0,0 +1,49 @@
+import pytest
+from sqlalchemy import create_engine, text
+from query_guard import QueryCostError, QueryGuard, QueryTimeoutError
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "guard.db"
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE sales (id INTEGER PRIMARY KEY, product_name TEXT, total_amount REAL)"))
+        conn.execute(text("INSERT INTO sales (product_name, total_amount) VALUES (:p, :a)"),
+                     [{"p": f"product {i % 20}", "a": i} for i in range(5000)])
+        conn.execute(text("ANALYZE"))
+    engine.dispose()
+    return path
+
+def test_expensive_query_is_refused(db_path):
+    guard = QueryGuard(create_engine(f"sqlite:///{db_path}"), max_cost=100000)
+    with pytest.raises(QueryCostError):
+        guard.check("SELECT COUNT(*) FROM sales a, sales b")
+    assert guard.rejected == 1
+
+def test_cheap_query_passes(db_path):
+    guard = QueryGuard(create_engine(f"sqlite:///{db_path}"), max_cost=100000)
+    estimate = guard.check("SELECT * FROM sales WHERE id = 3")
+    assert estimate["cost"] < 100000
+    assert guard.rejected == 0
+
+def test_connections_are_read_only(db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    QueryGuard(engine, read_only=True)
+    with engine.connect() as conn, pytest.raises(Exception, match="readonly"):
+        conn.execute(text("DELETE FROM sales"))
+
+def test_long_query_is_stopped(db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    guard = QueryGuard(engine, timeout=0.1)
+    with engine.connect() as conn, pytest.raises(QueryTimeoutError):
+        with guard.time_limit(conn):
+            conn.execute(text("SELECT COUNT(*) FROM sales a, sales b, sales c")).fetchall()
+    assert guard.timeouts == 1
+
+def test_per_call_limits_override_the_defaults(db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    guard = QueryGuard(engine, max_cost=100000, timeout=0.1)
+    guard.check("SELECT COUNT(*) FROM sales a, sales b", max_cost=0)
+    with engine.connect() as conn, guard.time_limit(conn, timeout=0):
+        conn.execute(text("SELECT COUNT(*) FROM sales a, sales b")).fetchall()
+    assert guard.rejected == 0 and guard.timeouts == 0
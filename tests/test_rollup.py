@@ -0,0 +1,63 @@
+import pytest
+from sqlalchemy import create_engine, text
+from index_advisor import Rollup, load_rollups, rollup_table_names
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rollup.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE sales (id INTEGER PRIMARY KEY, date TEXT, product_name TEXT, total_amount REAL)"))
+        insert(conn, [("2025-01-01", "Laptop", 100), ("2025-01-01", "Mouse", 10), ("2025-01-02", "Laptop", 200)])
+    return engine
+
+def insert(conn, rows):
+    conn.execute(text("INSERT INTO sales (date, product_name, total_amount) VALUES (:d, :p, :a)"),
+                 [{"d": d, "p": p, "a": a} for d, p, a in rows])
+
+def contents(conn):
+    return conn.execute(text("SELECT date, product_name, sum_total_amount, row_count FROM rollup_sales "
+                             "ORDER BY date, product_name")).fetchall()
+
+def make_rollup():
+    return Rollup("rollup_sales", "sales", ["date", "product_name"], ["total_amount"], date_column="date")
+
+def test_build_registers_rollup(engine):
+    with engine.begin() as conn:
+        make_rollup().build(conn)
+    assert [rollup.name for rollup in load_rollups(engine)] == ["rollup_sales"]
+    assert rollup_table_names(engine) == {"rollup_sales", "_advisor_rollups"}
+
+def test_refresh_only_folds_in_new_rows(engine):
+    rollup = make_rollup()
+    with engine.begin() as conn:
+        rollup.build(conn)
+        assert rollup.watermark == "3"
+        # A change to an already folded row is not picked up: refresh doesn't recompute
+        conn.execute(text("UPDATE sales SET total_amount = 999 WHERE id = 1"))
+        insert(conn, [("2025-01-02", "Laptop", 50), ("2025-01-03", "Mouse", 5)])
+        assert rollup.refresh(conn) == "5"
+        assert contents(conn) == [
+            ("2025-01-01", "Laptop", 100, 1),
+            ("2025-01-01", "Mouse", 10, 1),
+            ("2025-01-02", "Laptop", 250, 2),
+            ("2025-01-03", "Mouse", 5, 1),
+        ]
+
+def test_refresh_without_new_rows_changes_nothing(engine):
+    rollup = make_rollup()
+    with engine.begin() as conn:
+        rollup.build(conn)
+        before = contents(conn)
+        assert rollup.refresh(conn) == "3"
+        assert contents(conn) == before
+
+def test_rewrite_routes_group_by_to_rollup(engine):
+    rollup = make_rollup()
+    with engine.begin() as conn:
+        rollup.build(conn)
+    sql = "SELECT product_name, SUM(total_amount) AS total FROM sales GROUP BY product_name ORDER BY product_name"
+    routed = rollup.rewrite(sql)
+    assert "rollup_sales" in routed
+    with engine.connect() as conn:
+        assert conn.execute(text(routed)).fetchall() == conn.execute(text(sql)).fetchall()
+    assert rollup.rewrite("SELECT * FROM sales") is None
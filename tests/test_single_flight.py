@@ -0,0 +1,34 @@
+import threading
+from single_flight import SingleFlight
+
+def test_first_caller_leads_and_others_wait():
+    flights = SingleFlight()
+    flight, leader = flights.begin("question")
+    same, follower_leads = flights.begin("question")
+    assert leader and not follower_leads and same is flight
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(flights.wait(same, timeout=5)))
+    waiter.start()
+    flights.finish("question", flight, {"answer": 42})
+    waiter.join(5)
+    assert results == [{"answer": 42}]
+    assert flights.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 1, "fallbacks": 0}
+
+def test_leader_giving_up_makes_waiters_fall_back():
+    flights = SingleFlight()
+    flight, _ = flights.begin("question")
+    same, _ = flights.begin("question")
+    flights.finish("question", flight)
+    assert flights.wait(same, timeout=1) is None
+    assert flights.stats()["fallbacks"] == 1
+
+def test_finished_key_starts_a_new_flight():
+    flights = SingleFlight()
+    flight, _ = flights.begin("question")
+    flights.finish("question", flight, "first")
+    again, leader = flights.begin("question")
+    assert leader and again is not flight
+
+def test_different_keys_do_not_coalesce():
+    flights = SingleFlight()
+    assert flights.begin("a")[1] and flights.begin("b")[1]
@@ -0,0 +1,29 @@
+import pytest
+from sql_utils import UnsafeSQLError, ensure_select, fingerprint_sql
+
+@pytest.mark.parametrize("sql", [
+    "SELECT product_name, SUM(total_amount) FROM sales GROUP BY product_name",
+    "select * from sales;",
+    "WITH totals AS (SELECT product_name, SUM(quantity) AS units FROM sales GROUP BY product_name) SELECT * FROM totals",
+    "SELECT 'delete from sales' AS note",
+    "SELECT 1 -- ; DROP TABLE sales",
+])
+def test_ensure_select_accepts_single_select(sql):
+    assert ensure_select(sql)
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM sales",
+    "SELECT 1; DROP TABLE sales",
+    "WITH x AS (SELECT 1) DELETE FROM sales",
+    "SELECT * INTO sales_copy FROM sales",
+    "PRAGMA table_info(sales)",
+    "",
+])
+def test_ensure_select_rejects_everything_else(sql):
+    with pytest.raises(UnsafeSQLError):
+        ensure_select(sql)
+
+def test_fingerprint_ignores_literals_case_and_spacing():
+    assert fingerprint_sql("SELECT * FROM sales WHERE date >= '2025-01-01'") == \
+        fingerprint_sql("select *\n  from SALES where date >= '2024-06-30'")
+    assert fingerprint_sql("SELECT * FROM sales") != fingerprint_sql("SELECT * FROM stock")
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+def new_id(bits=64):
+    """Random hex id (128 bits for traces, 64 for spans, as in OpenTelemetry)"""
+    return os.urandom(bits // 8).hex()
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_id()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.status = "OK"
+
+
+class Tracer:
+    """Per-stage timing spans, kept in memory for percentiles and optionally written as JSONL.
+
+    Each JSONL line is one span in the OTLP/JSON span shape (traceId, spanId,
+    parentSpanId, startTimeUnixNano, attributes, ...), so the file can be
+    replayed into an OpenTelemetry collector.
+    """
+
+    def __init__(self, sink_path=None, window=1000):
+        self.sink_path = sink_path
+        self.window = window
+        self._durations = defaultdict(lambda: deque(maxlen=self.window))
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, trace_id=None, parent_id=None, **attributes):
+        """Time a block; set extra attributes (token or row counts) on the yielded span"""
+        span = Span(name, trace_id or new_id(128), parent_id, attributes)
+        start = time.time_ns()
+        try:
+            yield span
+        except Exception as e:
+            span.status = "ERROR"
+            span.attributes["error"] = str(e)
+            raise
+        finally:
+            self._finish(span, start, time.time_ns())
+
+    def record(self, name, start_ns, end_ns, trace_id=None, parent_id=None, span_id=None, status="OK", **attributes):
+        """Record a span measured by the caller (e.g. one that spans generator yields)"""
+        span = Span(name, trace_id or new_id(128), parent_id, attributes)
+        span.span_id = span_id or span.span_id
+        span.status = status
+        self._finish(span, start_ns, end_ns)
+        return span
+
+    def stage_stats(self):
+        """p50/p95 latency in milliseconds per span name over the recent window"""
+        with self._lock:
+            durations = {name: list(values) for name, values in self._durations.items()}
+        return {
+            name: {
+                "count": len(values),
+                "p50_ms": round(float(np.percentile(values, 50)), 1),
+                "p95_ms": round(float(np.percentile(values, 95)), 1)
+            }
+            for name, values in durations.items() if values
+        }
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+
+    def _finish(self, span, start_ns, end_ns):
+        with self._lock:
+            self._durations[span.name].append((end_ns - start_ns) / 1e6)
+            if self.sink_path:
+                with open(self.sink_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(self._to_otlp(span, start_ns, end_ns)) + "\n")
+
+    def _to_otlp(self, span, start_ns, end_ns):
+        attributes = []
+        for key, value in span.attributes.items():
+            if isinstance(value, bool):
+                attributes.append({"key": key, "value": {"boolValue": value}})
+            elif isinstance(value, int):
+                attributes.append({"key": key, "value": {"intValue": str(value)}})
+            elif isinstance(value, float):
+                attributes.append({"key": key, "value": {"doubleValue": value}})
+            else:
+                attributes.append({"key": key, "value": {"stringValue": str(value)}})
+        return {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id or "",
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": attributes,
+            "status": {"code": 1 if span.status == "OK" else 2},
+        }
+
+
+# Shared by the agent and the app; set TRACE_JSONL to also write spans to a file
+tracer = Tracer(sink_path=os.getenv("TRACE_JSONL"))